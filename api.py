@@ -0,0 +1,330 @@
+"""HTTP API for the compatibility check, for ELN/LIMS integrations.
+
+The knowledge base is loaded at startup and hot-reloaded when its workbooks change
+(reloader.KnowledgeBaseWatcher); every response carries the version it was computed
+against. Checks, renders and PDFs run on worker
+threads so the event loop keeps accepting requests, and concurrent single checks are
+coalesced into one vectorized engine.check_many call (micro-batching).
+
+    python api.py --port 8600
+
+    GET  /health                       knowledge-base version, size and last reload
+    GET  /excipients                   grid names with descriptions
+    GET  /explanations?a=...&b=...     rationale for one pair
+    POST /check                        {"excipients": [...], "conditions": [...], "normalize": false}
+    POST /check/batch                  {"formulations": [[...], ...] or [{"id": ..., "excipients": [...], "conditions": [...]}, ...],
+                                        "conditions": [...], "normalize": false}
+    POST /report                       {"excipients": [...]}  -> application/pdf
+"""
+import argparse
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import engine
+import figures
+import reloader
+import report
+
+MAX_BATCH = 256  # single checks coalesced into one engine call
+BATCH_WINDOW = 0.002  # seconds to wait for more single checks once one has arrived
+MAX_FORMULATIONS = 100_000  # per /check/batch request
+REPORT_CONCURRENCY = 4  # PDF renders in flight at once
+
+
+class BadRequest(Exception):
+    pass
+
+
+class CheckBatcher:
+    """Collects single-formulation checks and runs them through engine.check_many together.
+
+    Each check carries the knowledge base its request resolved names against, and a batch
+    runs one engine call per knowledge base, so a hot reload never mixes versions in a result.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, window=BATCH_WINDOW):
+        self.max_batch = max_batch
+        self.window = window
+        self.batches = 0
+        self.checks = 0
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def check(self, excipients, kb):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((excipients, kb, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                await self._run_group(group)
+
+    async def _run_group(self, group):
+        try:
+            result = await run_in_threadpool(engine.check_many, [e for e, _, _ in group], group[0][1])
+        except Exception as e:
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.checks += len(group)
+        for i, (_, _, future) in enumerate(group):
+            if not future.done():
+                future.set_result((result.worst_label(i), result.issues[i]))
+
+
+# --- Request parsing ---
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest("Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise BadRequest("Request body must be a JSON object.")
+    return body
+
+
+def name_list(value, field):
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise BadRequest(f"'{field}' must be a list of strings.")
+    return value
+
+
+def resolve(kb, names, normalize):
+    """(grid names, names that are not in the grid)."""
+    if normalize:
+        resolved, missing = kb.name_index.resolve_many(names)
+        return resolved, [r.name for r in missing]
+    known = [n.strip() for n in names if n.strip() in kb.excipient_ids]
+    return list(dict.fromkeys(known)), [n for n in names if n.strip() and n.strip() not in kb.excipient_ids]
+
+
+def issue_records(kb, issues):
+    return [
+        {"excipients": list(pair), "severity": severity, "explanation": kb.explanations.get(pair, engine.NO_EXPLANATION)}
+        for pair, severity in issues
+    ]
+
+
+def rule_records(matches):
+    return [
+        {"rule": m.rule.rule_id, "excipients": list(m.present), "severity": m.severity,
+         "condition": m.rule.condition or None, "explanation": m.rule.rationale}
+        for m in matches
+    ]
+
+
+# --- Endpoints ---
+async def health(request):
+    kb = request.app.state.get_kb()
+    batcher = request.app.state.batcher
+    return JSONResponse({
+        "status": "ok",
+        "version": kb.version,
+        "source": kb.source,
+        "excipients": len(kb.excipient_list),
+        "rules": len(kb.rules),
+        "batched_checks": batcher.checks,
+        "batches": batcher.batches,
+        "last_reload": request.app.state.last_reload(),
+    })
+
+
+async def excipients(request):
+    kb = request.app.state.get_kb()
+    return JSONResponse([{"name": name, "description": kb.descriptions.get(name)} for name in kb.excipient_list])
+
+
+async def explanation(request):
+    kb = request.app.state.get_kb()
+    a, b = request.query_params.get("a", "").strip(), request.query_params.get("b", "").strip()
+    if not a or not b:
+        raise BadRequest("Query parameters 'a' and 'b' are required.")
+    missing = [n for n in (a, b) if n not in kb.excipient_ids]
+    if missing:
+        return JSONResponse({"error": f"Unknown excipient(s): {missing}"}, status_code=404)
+    pair = tuple(sorted([a, b]))
+    level = int(kb.severity_matrix[kb.excipient_ids[a], kb.excipient_ids[b]])
+    return JSONResponse({
+        "excipients": list(pair),
+        "severity": engine.SEVERITY_LABELS.get(level, engine.COMPATIBLE),
+        "explanation": kb.explanations.get(pair),
+    })
+
+
+async def check(request):
+    kb = request.app.state.get_kb()
+    body = await read_json(request)
+    names = name_list(body.get("excipients"), "excipients")
+    conditions = name_list(body.get("conditions", []), "conditions")
+    excipients, unknown = resolve(kb, names, bool(body.get("normalize")))
+
+    _, issues = await request.app.state.batcher.check(excipients, kb)
+    matches = kb.rules.evaluate(excipients, conditions)
+    return JSONResponse({
+        "version": kb.version,
+        "excipients": excipients,
+        "unknown": unknown,
+        "worst": engine.worst_severity(issues + [(m.present, m.severity) for m in matches]),
+        "issues": issue_records(kb, issues),
+        "rules": rule_records(matches),
+    })
+
+
+async def check_batch(request):
+    kb = request.app.state.get_kb()
+    body = await read_json(request)
+    items = body.get("formulations")
+    if not isinstance(items, list):
+        raise BadRequest("'formulations' must be a list.")
+    if len(items) > MAX_FORMULATIONS:
+        raise BadRequest(f"At most {MAX_FORMULATIONS} formulations per request.")
+    normalize = bool(body.get("normalize"))
+    default_conditions = name_list(body.get("conditions", []), "conditions")
+    ids, names, conditions = [], [], []
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            ids.append(item.get("id", i))
+            conditions.append(name_list(item.get("conditions", default_conditions), f"formulations[{i}].conditions"))
+            item = item.get("excipients")
+        else:
+            ids.append(i)
+            conditions.append(default_conditions)
+        names.append(name_list(item, f"formulations[{i}]"))
+
+    def run():
+        # Name resolution, checks and the response body are all per-formulation work: kept off the event loop.
+        formulations, unknown = [], []
+        for item in names:
+            excipients, missing = resolve(kb, item, normalize)
+            formulations.append(excipients)
+            unknown.append(missing)
+        result = engine.check_many(formulations, kb)
+        matches = [kb.rules.evaluate(f, c) for f, c in zip(formulations, conditions)]
+        return JSONResponse({
+            "version": kb.version,
+            "seconds": result.seconds,
+            "results": [
+                {
+                    "id": ids[i],
+                    "worst": engine.worst_severity(result.issues[i] + [(m.present, m.severity) for m in matches[i]]),
+                    "issues": [{"excipients": list(pair), "severity": severity} for pair, severity in result.issues[i]],
+                    "rules": [{"rule": m.rule.rule_id, "excipients": list(m.present), "severity": m.severity}
+                              for m in matches[i]],
+                    "unknown": unknown[i],
+                }
+                for i in range(len(formulations))
+            ],
+        })
+
+    return await run_in_threadpool(run)
+
+
+async def pdf_report(request):
+    kb = request.app.state.get_kb()
+    body = await read_json(request)
+    excipients, _ = resolve(kb, name_list(body.get("excipients"), "excipients"), bool(body.get("normalize")))
+    conditions = name_list(body.get("conditions", []), "conditions")
+    ordered = sorted(excipients)
+
+    def render():
+        issues = engine.check_compatibility(ordered, kb)
+        png = figures.matrix_png(ordered, engine.severity_submatrix(ordered, kb)) if ordered else None
+        matches = kb.rules.evaluate(ordered, conditions)
+        return report.generate_pdf_report(ordered, issues, png, kb.explanations, matches).getvalue()
+
+    async with request.app.state.report_slots:
+        pdf = await run_in_threadpool(render)
+    return Response(pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": 'attachment; filename="Excipient_Compatibility_Report.pdf"'})
+
+
+async def bad_request(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=400)
+
+
+def reload_record(watcher):
+    if watcher is None or not watcher.reloads and not watcher.error:
+        return None
+    last = watcher.reloads[-1] if watcher.reloads else None
+    return {
+        "version": last.diff.new_version if last else None,
+        "summary": last.diff.summary() if last else None,
+        "changed_pairs": len(last.diff.changed_pairs) if last else None,
+        "error": watcher.error,
+    }
+
+
+def create_app(kb=None):
+    """The API app. Without `kb`, the knowledge base is loaded at startup and watched for changes."""
+
+    async def lifespan(app):
+        watcher = None
+        if kb is None:
+            watcher = await run_in_threadpool(lambda: reloader.KnowledgeBaseWatcher().start())
+            app.state.get_kb = lambda: watcher.current
+        else:
+            app.state.get_kb = lambda: kb
+        app.state.last_reload = lambda: reload_record(watcher)
+        app.state.batcher = CheckBatcher()
+        app.state.report_slots = asyncio.Semaphore(REPORT_CONCURRENCY)
+        await app.state.batcher.start()
+        yield
+        await app.state.batcher.stop()
+        if watcher is not None:
+            watcher.stop()
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/excipients", excipients),
+            Route("/explanations", explanation),
+            Route("/check", check, methods=["POST"]),
+            Route("/check/batch", check_batch, methods=["POST"]),
+            Route("/report", pdf_report, methods=["POST"]),
+        ],
+        exception_handlers={BadRequest: bad_request},
+        lifespan=lifespan,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the excipient compatibility check over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
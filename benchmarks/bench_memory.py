@@ -0,0 +1,141 @@
+"""Memory report: knowledge-base structures per layout on synthetic grids.
+
+Each layout is built from the same synthetic grid and rationale texts under tracemalloc,
+and the bytes it still holds afterwards are reported (severity store, explanations and
+descriptions separately), along with the time to check a batch of formulations.
+
+    name-sets   Major and Minor pairs as sets of name tuples, explanations in a dict keyed
+                by name tuples, descriptions in a DataFrame (the original app's structures)
+    dense       N x N int8 severity matrix, explanations dict, descriptions dict
+    compact     packed upper-triangle severity (compact.PackedSeverity) and
+                compact.ExplanationTable, as knowledge_base builds for large grids
+
+Every pair gets its own rationale unless `--distinct-texts` limits the number of
+different texts, as in a workbook where many rows share a rationale.
+
+    python benchmarks/bench_memory.py --sizes 1000 10000 --distinct-texts 2000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import engine  # noqa: E402
+import knowledge_base  # noqa: E402
+from bench_pipeline import synthetic_grid  # noqa: E402
+from compact import ExplanationTable, PackedSeverity  # noqa: E402
+
+GRID_SIZES = (1_000, 5_000, 10_000)
+LAYOUTS = ("name-sets", "dense", "compact")
+CHECK_FORMULATIONS = 2_000
+CHECK_SIZE = 20
+
+
+def rationale_texts(count, distinct, rng):
+    """One new str object per pair, as read from a workbook cell; `distinct` > 0 repeats that many texts."""
+    numbers = rng.integers(distinct, size=count) if distinct else np.arange(count)
+    return [f"Synthetic rationale {k}: the pair reacts under the stated conditions." for k in numbers.tolist()]
+
+
+def traced(build):
+    """(result of build(), bytes still allocated by it)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, retained
+
+
+def build_layout(layout, dense, names, rows, cols, distinct, seed):
+    """{"severity": ..., "explanations": ..., "descriptions": ...} for one layout, each traced separately."""
+    rng = np.random.default_rng(seed)
+    excipient_ids = {name: i for i, name in enumerate(names)}
+    pairs = list(zip(rows.tolist(), cols.tolist()))
+    parts, sizes = {}, {}
+
+    def severity():
+        if layout == "name-sets":
+            levels = dense[rows, cols]
+            return ({(names[i], names[j]) for (i, j), level in zip(pairs, levels.tolist()) if level == 2},
+                    {(names[i], names[j]) for (i, j), level in zip(pairs, levels.tolist()) if level == 1})
+        if layout == "dense":
+            return dense.copy()
+        return PackedSeverity.from_dense(dense)
+
+    def explanations():
+        texts = rationale_texts(len(pairs), distinct, rng)
+        by_pair = {(names[i], names[j]): text for (i, j), text in zip(pairs, texts)}
+        if layout == "compact":
+            return ExplanationTable.from_pairs(by_pair, excipient_ids)
+        return by_pair
+
+    def descriptions():
+        texts = [f"Synthetic excipient {i}, used as a filler or binder." for i in range(len(names))]
+        if layout == "name-sets":
+            return pd.DataFrame({"Excipient": names, "Description": texts}, dtype=object)
+        return dict(zip(names, texts))
+
+    for name, build in (("severity", severity), ("explanations", explanations), ("descriptions", descriptions)):
+        parts[name], sizes[name] = traced(build)
+    return parts, sizes
+
+
+def check_seconds(parts, names, rng):
+    """Batch check time on this layout's severity store (the name-set layout checks pair by pair)."""
+    formulations = [rng.choice(names, CHECK_SIZE, replace=False).tolist() for _ in range(CHECK_FORMULATIONS)]
+    start = time.perf_counter()
+    if isinstance(parts["severity"], tuple):
+        major, minor = parts["severity"]
+        for formulation in formulations:
+            ordered = sorted(formulation)
+            _ = [(a, b) for k, a in enumerate(ordered) for b in ordered[k + 1:] if (a, b) in major or (a, b) in minor]
+    else:
+        kb = knowledge_base.KnowledgeBase(
+            descriptions={}, explanations={}, severity_matrix=parts["severity"],
+            excipient_ids={name: i for i, name in enumerate(names)}, excipient_list=names,
+            version="memory-report", load_seconds=0.0, source="synthetic",
+        )
+        engine.check_many(formulations, kb)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=GRID_SIZES)
+    parser.add_argument("--distinct-texts", type=int, default=0, help="0: every pair has its own rationale")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'grid':>7} {'conflicts':>10} {'layout':<10} {'severity':>10} {'explanations':>13} {'descriptions':>13}"
+          f" {'total MiB':>10} {'check ms':>9}")
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        grid = synthetic_grid(size, rng)
+        dense, excipient_ids = knowledge_base.build_incompatibility_index(grid)
+        del grid
+        names = list(excipient_ids)
+        rows, cols = np.nonzero(np.triu(dense, k=1))
+        for layout in LAYOUTS:
+            parts, sizes = build_layout(layout, dense, names, rows, cols, args.distinct_texts, args.seed)
+            seconds = check_seconds(parts, names, np.random.default_rng(args.seed))
+            mib = {k: v / 2**20 for k, v in sizes.items()}
+            print(f"{size:>7} {len(rows):>10,} {layout:<10} {mib['severity']:>10.1f} {mib['explanations']:>13.1f}"
+                  f" {mib['descriptions']:>13.1f} {sum(mib.values()):>10.1f} {seconds * 1000:>9.1f}", flush=True)
+            del parts
+
+
+if __name__ == "__main__":
+    main()
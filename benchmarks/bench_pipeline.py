@@ -0,0 +1,221 @@
+"""Scaling benchmark of the compatibility pipeline on synthetic knowledge bases.
+
+For each grid size a random symmetric severity grid is generated (with the Minor/Major
+densities of the shipped grid by default) and each stage is timed and its peak traced
+memory recorded:
+
+    index    grid DataFrame -> severity matrix (knowledge_base.build_incompatibility_index)
+    load     snapshot write + memory-mapped load (knowledge_base.write_snapshot / load_snapshot)
+    check    pairwise check of one formulation (engine.check_compatibility)
+    matrix   severity submatrix for the figure (engine.severity_submatrix)
+    figure   adjacency matrix PNG (figures.matrix_png)
+    pdf      single-formulation report (report.generate_pdf_report)
+
+The per-formulation stages run for each formulation size. Results are written as JSON
+tagged with the git commit, and `--compare` reports the stages whose best time got slower
+than in a previous run (exit status 1 if any did):
+
+    python benchmarks/bench_pipeline.py --output new.json --compare benchmarks/results/<old>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import engine  # noqa: E402
+import figures  # noqa: E402
+import knowledge_base  # noqa: E402
+import report  # noqa: E402
+from compact import ExplanationTable  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+GRID_SIZES = (100, 1_000, 10_000)
+FORMULATION_SIZES = (5, 20, 50, 200)
+MINOR_DENSITY = 0.012
+MAJOR_DENSITY = 0.0034
+MIN_BATCH_SECONDS = 0.05
+MAX_EXPLANATIONS = 200_000  # larger grids get no rationale texts; reports fall back to the default text
+
+
+def synthetic_grid(size, rng, minor=MINOR_DENSITY, major=MAJOR_DENSITY):
+    """Grid DataFrame shaped like the workbook: excipient names on both axes, 1/2 in conflicting cells."""
+    names = [f"Excipient {i:05d}" for i in range(size)]
+    draw = rng.random((size, size), dtype=np.float32)
+    values = np.where(draw < major, 2, np.where(draw < major + minor, 1, 0)).astype(np.int8)
+    values = np.triu(values, k=1)
+    values = values + values.T
+    return pd.DataFrame(values, index=names, columns=names)
+
+
+def synthetic_knowledge_base(severity_matrix, excipient_ids, rng):
+    names = list(excipient_ids)
+    rows, cols = np.nonzero(np.triu(severity_matrix, k=1))
+    explanations = {}
+    if len(rows) <= MAX_EXPLANATIONS:
+        explanations = {(names[a], names[b]): f"Synthetic rationale {k}." for k, (a, b) in enumerate(zip(rows, cols))}
+    return knowledge_base.KnowledgeBase(
+        descriptions={name: f"Synthetic excipient {i}." for i, name in enumerate(names)},
+        explanations=ExplanationTable.from_pairs(explanations, excipient_ids),
+        severity_matrix=knowledge_base.compact_severity(severity_matrix),
+        excipient_ids=excipient_ids,
+        excipient_list=names,
+        version=f"synthetic-{len(names)}-{int(rng.integers(1 << 31))}",
+        load_seconds=0.0,
+        source="synthetic",
+    )
+
+
+def measure(stage, repeat, min_batch_seconds=MIN_BATCH_SECONDS):
+    """(per-call timings in seconds, peak traced bytes).
+
+    Fast stages are called in batches of at least `min_batch_seconds` so sub-millisecond
+    timings are stable enough to compare. Memory is traced on a separate call so tracing
+    does not skew the timings.
+    """
+    start = time.perf_counter()
+    stage()
+    calls = max(1, int(min_batch_seconds / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            stage()
+        timings.append((time.perf_counter() - start) / calls)
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(grid_sizes, formulation_sizes, repeat, seed, skip):
+    rng = np.random.default_rng(seed)
+    results = []
+
+    def record(stage, grid, formulation, fn):
+        if stage in skip:
+            return None
+        timings, peak = measure(fn, repeat)
+        result = {
+            "stage": stage,
+            "grid": grid,
+            "formulation": formulation,
+            "median_s": statistics.median(timings),
+            "min_s": min(timings),
+            "peak_bytes": peak,
+        }
+        results.append(result)
+        size = f"{formulation:>4}" if formulation else "   -"
+        print(f"{stage:<7} grid {grid:>6}  formulation {size}  median {result['median_s'] * 1000:>10.2f} ms"
+              f"  peak {peak / 2**20:>8.1f} MiB", flush=True)
+        return result
+
+    for grid_size in grid_sizes:
+        grid = synthetic_grid(grid_size, rng)
+        severity_matrix, excipient_ids = knowledge_base.build_incompatibility_index(grid)
+        record("index", grid_size, None, lambda: knowledge_base.build_incompatibility_index(grid))
+        del grid
+        kb = synthetic_knowledge_base(severity_matrix, excipient_ids, rng)
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            def load():
+                knowledge_base.write_snapshot(kb, snapshot_dir)
+                assert knowledge_base.load_snapshot(kb.version, snapshot_dir) is not None
+
+            record("load", grid_size, None, load)
+
+        for size in formulation_sizes:
+            if size > grid_size:
+                continue
+            excipients = sorted(rng.choice(kb.excipient_list, size, replace=False).tolist())
+            issues = engine.check_compatibility(excipients, kb)
+            matrix = engine.severity_submatrix(excipients, kb)
+            record("check", grid_size, size, lambda: engine.check_compatibility(excipients, kb))
+            record("matrix", grid_size, size, lambda: engine.severity_submatrix(excipients, kb))
+            png = figures.matrix_png(excipients, matrix) if "pdf" not in skip else None
+            record("figure", grid_size, size, lambda: figures.matrix_png(excipients, matrix))
+            record("pdf", grid_size, size, lambda: report.generate_pdf_report(excipients, issues, png, kb.explanations))
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Prints stages slower than `threshold` x the baseline; returns how many regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["stage"], r["grid"], r["formulation"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['commit']} ({baseline_path}):")
+    regressions = 0
+    for r in results:
+        old = before.get((r["stage"], r["grid"], r["formulation"]))
+        if old is None or not old["min_s"]:
+            continue
+        ratio = r["min_s"] / old["min_s"]
+        if ratio > threshold:
+            regressions += 1
+            size = r["formulation"] or "-"
+            print(f"  slower: {r['stage']:<7} grid {r['grid']:>6}  formulation {size:>4}  {ratio:.2f}x"
+                  f"  ({old['min_s'] * 1000:.3f} -> {r['min_s'] * 1000:.3f} ms)")
+    if not regressions:
+        print(f"  no stage slower than {threshold:.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=GRID_SIZES)
+    parser.add_argument("--formulation-sizes", type=int, nargs="+", default=FORMULATION_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["index", "load", "check", "matrix", "figure", "pdf"],
+                        help="stages to leave out (e.g. figure pdf for a quick run)")
+    parser.add_argument("--output", default=None, help="results JSON (default: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run(args.grid_sizes, args.formulation_sizes, args.repeat, args.seed, set(args.skip))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "settings": {"repeat": args.repeat, "seed": args.seed},
+            "results": results,
+        }, f, indent=1)
+    print(f"\nWrote {len(results)} results to {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
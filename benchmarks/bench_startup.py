@@ -0,0 +1,65 @@
+"""Cold-start comparison: knowledge base from the Excel workbooks vs. from the binary snapshot.
+
+Each load runs in a fresh interpreter so import and page-cache effects match an app
+cold start.
+
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import knowledge_base  # noqa: E402
+
+LOADERS = {
+    "excel": "knowledge_base.load_from_excel()",
+    "snapshot": "assert knowledge_base.load_snapshot(knowledge_base.content_hash()) is not None",
+}
+
+
+def time_cold_load(statement, repeat):
+    script = f"import knowledge_base; {statement}"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_warm_load(statement, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        exec(statement, {"knowledge_base": knowledge_base})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    knowledge_base.write_snapshot(knowledge_base.load_from_excel())
+
+    print(f"{'loader':<10} {'cold median (s)':>16} {'load-only median (s)':>22}")
+    results = {}
+    for name, statement in LOADERS.items():
+        cold = statistics.median(time_cold_load(statement, args.repeat))
+        warm = statistics.median(time_warm_load(statement, args.repeat))
+        results[name] = (cold, warm)
+        print(f"{name:<10} {cold:>16.3f} {warm:>22.4f}")
+
+    excel, snapshot = results["excel"], results["snapshot"]
+    print(f"\nsnapshot speedup: {excel[0] / snapshot[0]:.1f}x cold, {excel[1] / snapshot[1]:.1f}x load-only")
+
+
+if __name__ == "__main__":
+    main()
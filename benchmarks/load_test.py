@@ -0,0 +1,103 @@
+"""Load test for the HTTP API (api.py): latency percentiles and throughput under concurrency.
+
+Each client thread keeps one HTTP/1.1 connection open and sends requests back to back
+for the test duration. Formulations are random draws from the server's /excipients.
+
+    python api.py &
+    python benchmarks/load_test.py --clients 32 --duration 10 --endpoint check
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def request(connection, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload else {}
+    connection.request(method, path, body=payload, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    return response.status, data
+
+
+def make_body(endpoint, names, rng, size, batch):
+    if endpoint == "batch":
+        return {"formulations": [rng.sample(names, size) for _ in range(batch)]}
+    return {"excipients": rng.sample(names, size)}
+
+
+def client(url, endpoint, names, size, batch, stop_at, seed, latencies, errors):
+    rng = random.Random(seed)
+    path = {"check": "/check", "batch": "/check/batch", "report": "/report"}[endpoint]
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    while time.perf_counter() < stop_at:
+        body = make_body(endpoint, names, rng, size, batch)
+        start = time.perf_counter()
+        try:
+            status, _ = request(connection, "POST", path, body)
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+            continue
+        if status != 200:
+            errors.append(status)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8600")
+    parser.add_argument("--endpoint", choices=["check", "batch", "report"], default="check")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--size", type=int, default=10, help="excipients per formulation")
+    parser.add_argument("--batch", type=int, default=100, help="formulations per /check/batch request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    _, data = request(connection, "GET", "/excipients")
+    names = [e["name"] for e in json.loads(data)]
+    connection.close()
+    size = min(args.size, len(names))
+
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(url, args.endpoint, names, size, args.batch, stop_at,
+                                               args.seed + i, latencies, errors))
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"No successful requests ({len(errors)} errors).")
+        return
+    rate = len(latencies) / elapsed
+    print(f"{args.endpoint}: {len(latencies):,} requests in {elapsed:.1f}s with {args.clients} clients, {len(errors)} errors")
+    print(f"  throughput  {rate:,.0f} req/s" + (f"  ({rate * args.batch:,.0f} formulations/s)" if args.endpoint == "batch" else ""))
+    print(f"  latency     p50 {percentile(latencies, 50) * 1000:.1f} ms   p99 {percentile(latencies, 99) * 1000:.1f} ms"
+          f"   mean {statistics.mean(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Background evaluation of uploaded formulation libraries for the app.
+
+A BulkJob checks an uploaded table a chunk at a time on a worker thread and publishes
+rows as they finish, so the page can poll `progress()` and show partial results. Jobs run
+on a small executor shared by all sessions: uploads queue behind each other instead of
+competing with the threads that serve interactive reruns.
+
+    job = BulkJob(read_upload("library.csv"), kb)
+    executor.submit(job.run)
+    done, total, finished = job.progress()
+"""
+import threading
+import time
+
+import pandas as pd
+
+import engine
+import screen
+
+CHUNK_ROWS = 500
+LIST_COLUMN = "excipients"
+SEPARATOR = ";"
+SEVERITY_ORDER = (engine.COMPATIBLE, "Minor", "Major")  # sort order of the "Worst Severity" column
+
+
+def read_upload(file, name=None):
+    """DataFrame of strings from a CSV or XLSX upload (a path or a file object with `.name`)."""
+    name = (name or getattr(file, "name", None) or str(file)).lower()
+    if name.endswith((".xlsx", ".xls")):
+        return pd.read_excel(file, dtype=str).fillna("")
+    return pd.read_csv(file, dtype=str, keep_default_na=False)
+
+
+class BulkJob:
+    def __init__(self, frame, kb, id_column=None, column=LIST_COLUMN, separator=SEPARATOR, chunk_rows=CHUNK_ROWS):
+        self.frame = frame
+        self.kb = kb
+        self.id_column = id_column
+        self.column = column
+        self.separator = separator
+        self.chunk_rows = chunk_rows
+        self.error = None
+        self.seconds = 0.0
+        self._rows = []  # one dict per evaluated formulation, in input order
+        self._finished = False
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            for first in range(0, len(self.frame), self.chunk_rows):
+                if self._cancelled.is_set():
+                    break
+                rows = self._check_chunk(self.frame.iloc[first:first + self.chunk_rows], first)
+                with self._lock:
+                    self._rows.extend(rows)
+        except Exception as e:  # surfaced in the UI instead of dying silently on the worker thread
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._finished = True
+
+    def _check_chunk(self, chunk, first):
+        parsed = screen.parse_formulations(chunk, self.column, self.separator, self.id_column, first)
+        formulations, unresolved = screen.resolve_formulations(parsed, self.kb)
+        result = engine.check_many(formulations, self.kb)
+        names = chunk[self.id_column].tolist() if self.id_column else range(first + 1, first + len(chunk) + 1)
+
+        rows = []
+        for i, (name, excipients) in enumerate(zip(names, formulations)):
+            rule_matches = self.kb.rules.evaluate(excipients)
+            worst = engine.worst_severity(result.issues[i] + [(m.present, m.severity) for m in rule_matches])
+            rows.append({
+                "name": str(name),
+                "excipients": excipients,
+                "issues": result.issues[i],
+                "rule_matches": rule_matches,
+                "worst": worst,
+                "conflicts": len(result.issues[i]) + len(rule_matches),
+                "unresolved": unresolved[i],
+            })
+        return rows
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def progress(self):
+        """(rows done, total rows, finished)."""
+        with self._lock:
+            return len(self._rows), len(self.frame), self._finished
+
+    def row(self, i):
+        with self._lock:
+            return self._rows[i]
+
+    def table(self):
+        """The rows evaluated so far, for display."""
+        with self._lock:
+            rows = list(self._rows)
+        worst = [r["worst"] for r in rows]
+        return pd.DataFrame({
+            "Formulation": [r["name"] for r in rows],
+            "Worst Severity": pd.Categorical(worst, categories=SEVERITY_ORDER, ordered=True),
+            "Severity Level": [SEVERITY_ORDER.index(w) for w in worst],  # numeric, for sorting in the grid
+            "Conflicts": [r["conflicts"] for r in rows],
+            "Excipients": [len(r["excipients"]) for r in rows],
+            "Unresolved": [r["unresolved"] for r in rows],
+        })
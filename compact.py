@@ -0,0 +1,190 @@
+"""Memory-compact stores for large knowledge bases.
+
+PackedSeverity keeps only the upper triangle of the symmetric severity matrix, N(N-1)/2
+int8 cells instead of N^2, and answers the indexing the engine uses on the dense array:
+`m[rows, cols]` with integer arrays (including np.ix_), `m[i, ids]` and row blocks
+`m[start:stop]`. `np.asarray(m)` rebuilds the dense matrix for code that wants it whole.
+
+ExplanationTable is a read-only mapping {sorted name pair: rationale} stored as sorted
+integer pair keys (i * N + j on excipient ids) indexing a table of distinct texts, so a
+rationale shared by many pairs is stored once and a pair costs 12 bytes rather than a
+tuple, two references and a dict slot.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+
+def triangle_size(size):
+    return size * (size - 1) // 2
+
+
+class PackedSeverity:
+    def __init__(self, data, size):
+        if len(data) != triangle_size(size):
+            raise ValueError(f"Packed severity has {len(data)} cells; {size} excipients need {triangle_size(size)}.")
+        self.data = data
+        self.size = size
+
+    @classmethod
+    def from_dense(cls, matrix):
+        size = len(matrix)
+        data = np.empty(triangle_size(size), dtype=np.int8)
+        for i in range(size - 1):
+            start = cls._offset(i, size)
+            data[start:start + size - i - 1] = matrix[i, i + 1:]
+        return cls(data, size)
+
+    @staticmethod
+    def _offset(i, size):
+        """Position of cell (i, i + 1) in the packed data."""
+        return i * (2 * size - i - 1) // 2
+
+    ndim = 2
+    dtype = np.dtype(np.int8)
+
+    @property
+    def shape(self):
+        return self.size, self.size
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            if isinstance(key, slice) and key.step in (None, 1):
+                return self._block(*key.indices(self.size)[:2])
+            rows = np.arange(self.size)[key]
+            if np.ndim(rows) == 0:
+                return self._row(int(rows))
+            return self[rows[:, None], np.arange(self.size)[None, :]]
+        rows, cols = key
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            raise TypeError("PackedSeverity takes integer (array) indices for both axes, or a row selection alone.")
+        rows, cols = np.broadcast_arrays(np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp))
+        low, high = np.minimum(rows, cols), np.maximum(rows, cols)
+        diagonal = low == high
+        if not len(self.data):  # a single excipient: only the diagonal exists
+            values = np.zeros(rows.shape, dtype=np.int8)
+            return values[()] if values.ndim == 0 else values
+        flat = np.where(diagonal, 0, low * (2 * self.size - low - 3) // 2 + high - 1)
+        values = np.asarray(self.data[flat.ravel()]).reshape(flat.shape)
+        values[diagonal] = 0
+        return values[()] if values.ndim == 0 else values
+
+    def _block(self, start, stop):
+        """Dense rows start..stop-1, assembled from contiguous runs of the packed data."""
+        stop = max(start, stop)
+        block = np.zeros((stop - start, self.size), dtype=np.int8)
+        for i in range(start, stop):
+            offset = self._offset(i, self.size)
+            block[i - start, i + 1:] = self.data[offset:offset + self.size - i - 1]
+        for j in range(start):  # left of the block: cells (j, start..stop-1) of earlier rows
+            offset = self._offset(j, self.size) + start - j - 1
+            block[:, j] = self.data[offset:offset + stop - start]
+        square = block[:, start:stop]
+        square += np.triu(square, 1).T
+        return block
+
+    def _row(self, i):
+        row = np.empty(self.size, dtype=np.int8)
+        start = self._offset(i, self.size)
+        row[i + 1:] = self.data[start:start + self.size - i - 1]
+        row[i] = 0
+        if i:
+            row[:i] = self[np.arange(i), i]
+        return row
+
+    def upper_nonzero(self):
+        """(rows, cols, levels) of every nonzero cell above the diagonal, read straight from the packed data."""
+        flat = np.flatnonzero(self.data)
+        offsets = self._offset(np.arange(self.size, dtype=np.intp), self.size)
+        rows = np.searchsorted(offsets, flat, side="right") - 1
+        cols = flat - offsets[rows] + rows + 1
+        return rows, cols, np.asarray(self.data[flat])
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.zeros(self.shape, dtype=np.int8)
+        for i in range(self.size - 1):
+            start = self._offset(i, self.size)
+            dense[i, i + 1:] = self.data[start:start + self.size - i - 1]
+        dense += dense.T
+        return dense if dtype is None else dense.astype(dtype)
+
+
+class ExplanationTable(Mapping):
+    def __init__(self, excipient_ids, keys, text_ids, texts, other=None):
+        self.excipient_ids = excipient_ids
+        self.excipient_list = list(excipient_ids)
+        self.pair_keys = keys  # sorted int64 pair keys
+        self.text_ids = text_ids
+        self.texts = texts
+        self.other = other or {}  # pairs naming an excipient that is not in the grid
+
+    @classmethod
+    def from_pairs(cls, explanations, excipient_ids):
+        """Builds the table from {sorted pair: text} or an iterable of (a, b, text)."""
+        items = ((a, b, text) for (a, b), text in explanations.items()) if isinstance(explanations, Mapping) else explanations
+        size = len(excipient_ids)
+        texts, text_index, keys, text_ids, other = [], {}, [], [], {}
+        for a, b, text in items:
+            i, j = excipient_ids.get(a), excipient_ids.get(b)
+            if i is None or j is None or i == j:
+                other[tuple(sorted([a, b]))] = text
+                continue
+            position = text_index.get(text)
+            if position is None:
+                position = text_index[text] = len(texts)
+                texts.append(text)
+            keys.append(min(i, j) * size + max(i, j))
+            text_ids.append(position)
+        keys = np.array(keys, dtype=np.int64)
+        text_ids = np.array(text_ids, dtype=np.int32)
+        # Later rows win, as they did when the workbook was read into a dict.
+        order = np.argsort(keys, kind="stable")
+        keys, text_ids = keys[order], text_ids[order]
+        last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.zeros(0, dtype=bool)
+        return cls(excipient_ids, keys[last], text_ids[last], texts, other)
+
+    def _position(self, pair):
+        try:
+            a, b = pair
+        except (TypeError, ValueError):
+            return None
+        i, j = self.excipient_ids.get(a), self.excipient_ids.get(b)
+        if i is None or j is None or i == j:
+            return None
+        key = min(i, j) * len(self.excipient_ids) + max(i, j)
+        position = int(np.searchsorted(self.pair_keys, key))
+        if position < len(self.pair_keys) and self.pair_keys[position] == key:
+            return position
+        return None
+
+    def __getitem__(self, pair):
+        position = self._position(pair)
+        if position is not None:
+            return self.texts[self.text_ids[position]]
+        return self.other[pair]
+
+    def __iter__(self):
+        size = len(self.excipient_ids)
+        for key in self.pair_keys.tolist():
+            i, j = divmod(key, size)
+            yield tuple(sorted([self.excipient_list[i], self.excipient_list[j]]))
+        yield from self.other
+
+    def __len__(self):
+        return len(self.pair_keys) + len(self.other)
+
+    def items(self):
+        """(pair, text) in key order, without a lookup per pair."""
+        texts = self.texts
+        return zip(self, [texts[k] for k in self.text_ids.tolist()] + list(self.other.values()))
+
+    @property
+    def nbytes(self):
+        return self.pair_keys.nbytes + self.text_ids.nbytes
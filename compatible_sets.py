@@ -0,0 +1,154 @@
+"""Largest compatible subsets of a formulation: which excipients to drop to clear every conflict.
+
+A compatible subset is an independent set of the conflict graph (edge = Major or Minor
+incompatibility), so this is a maximum independent set search. It runs as a
+branch-and-bound maximum clique search on the complement graph (Tomita-style greedy
+colouring bound) with Python ints as vertex bitsets, and stops at a time budget,
+returning the best subsets found so far.
+"""
+import heapq
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import engine
+
+# Nodes expanded between two clock reads.
+_CLOCK_INTERVAL = 256
+
+
+@dataclass
+class SubsetSearchResult:
+    excipients: list  # the (deduplicated) selection that was searched
+    subsets: list  # ranked, largest first; each a sorted list of names
+    complete: bool  # False if the time budget ran out before the search finished
+    seconds: float
+    nodes: int
+
+    def dropped(self, subset):
+        keep = set(subset)
+        return [e for e in self.excipients if e not in keep]
+
+
+class _Timeout(Exception):
+    pass
+
+
+def conflict_bitsets(matrix, min_severity=1):
+    """Bitset of conflicting positions per position of a (symmetric) severity submatrix."""
+    conflicts = np.asarray(matrix) >= min_severity
+    np.fill_diagonal(conflicts, False)
+    return [sum(1 << int(j) for j in np.flatnonzero(row)) for row in conflicts]
+
+
+class _Search:
+    def __init__(self, conflicts, vertices, limit, deadline):
+        self.conflicts = conflicts
+        full = sum(1 << v for v in vertices)
+        # Complement-graph adjacency restricted to the vertices being searched.
+        self.compatible = [full & ~c & ~(1 << v) for v, c in enumerate(conflicts)]
+        self.vertices = vertices
+        self.full = full
+        self.limit = limit
+        self.deadline = deadline
+        self.best = []  # min-heap of (size, bits)
+        self.nodes = 0
+
+    def threshold(self):
+        return self.best[0][0] if len(self.best) >= self.limit else 0
+
+    def record(self, bits, size):
+        # Only keep maximal sets: every vertex left out must conflict with something kept.
+        for v in self.vertices:
+            if not bits >> v & 1 and not self.conflicts[v] & bits:
+                return
+        entry = (size, bits)
+        if entry in self.best:
+            return
+        if len(self.best) < self.limit:
+            heapq.heappush(self.best, entry)
+        elif entry > self.best[0]:
+            heapq.heapreplace(self.best, entry)
+
+    def greedy(self):
+        """Min-degree greedy maximal set, so a search that times out early still has an answer."""
+        bits, candidates = 0, self.full
+        while candidates:
+            v = min(_members(candidates), key=lambda u: bin(self.conflicts[u] & candidates).count("1"))
+            bits |= 1 << v
+            candidates &= self.compatible[v]
+        self.record(bits, bin(bits).count("1"))
+
+    def colour_sort(self, candidates):
+        order, bounds, colour = [], [], 0
+        uncoloured = candidates
+        while uncoloured:
+            colour += 1
+            available = uncoloured
+            while available:
+                v = (available & -available).bit_length() - 1
+                available &= ~(1 << v) & ~self.compatible[v]
+                uncoloured &= ~(1 << v)
+                order.append(v)
+                bounds.append(colour)
+        return order, bounds
+
+    def expand(self, bits, size, candidates):
+        self.nodes += 1
+        if self.nodes % _CLOCK_INTERVAL == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout
+        order, bounds = self.colour_sort(candidates)
+        for v, bound in zip(reversed(order), reversed(bounds)):
+            if size + bound <= self.threshold():
+                return
+            remaining = candidates & self.compatible[v]
+            if remaining:
+                self.expand(bits | 1 << v, size + 1, remaining)
+            else:
+                self.record(bits | 1 << v, size + 1)
+            candidates &= ~(1 << v)
+
+
+def _members(bits):
+    members = []
+    while bits:
+        low = bits & -bits
+        members.append(low.bit_length() - 1)
+        bits ^= low
+    return members
+
+
+def largest_compatible_subsets(excipients, kb, limit=5, time_budget=0.5, min_severity=1):
+    """Up to `limit` maximal compatible subsets of `excipients`, largest first.
+
+    `min_severity=2` only treats Major incompatibilities as conflicts.
+    """
+    start = time.perf_counter()
+    excipients = list(dict.fromkeys(e.strip() for e in excipients))
+    conflicts = conflict_bitsets(engine.severity_submatrix(excipients, kb), min_severity)
+
+    # Excipients without conflicts belong to every maximal subset; search only the rest.
+    free = sum(1 << v for v, c in enumerate(conflicts) if not c)
+    vertices = [v for v, c in enumerate(conflicts) if c]
+    search = _Search(conflicts, vertices, limit, start + time_budget)
+    complete = True
+    if vertices:
+        try:
+            search.greedy()
+            search.expand(0, 0, search.full)
+        except _Timeout:
+            complete = False
+        ranked = sorted(search.best, reverse=True)
+        found = [bits for _, bits in ranked]
+    else:
+        found = [0]
+
+    subsets = [sorted(excipients[v] for v in _members(bits | free)) for bits in found]
+    return SubsetSearchResult(
+        excipients=excipients,
+        subsets=subsets,
+        complete=complete,
+        seconds=time.perf_counter() - start,
+        nodes=search.nodes,
+    )
@@ -0,0 +1,117 @@
+"""Analytics over the whole incompatibility grid: per-excipient conflict profiles, clusters and hubs.
+
+The grid is read once into a sparse edge list (one row block of the severity matrix at a
+time, or straight from the packed upper triangle, so no N x N temporary is built). Degrees and risk scores come from bincounts over
+the edges and clusters from networkx on the edge list. Only the conflicts themselves are
+ever visited in Python, so cost grows with the number of conflicts, not with N^2.
+
+Risk is the severity-weighted degree (Major counts twice), the score used to order
+excipients from least to most conflict-prone in the picker and in recommendations.
+"""
+from dataclasses import dataclass
+from functools import cached_property
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from compact import PackedSeverity
+
+# Rows of the severity matrix scanned per step when extracting edges.
+ROW_BLOCK = 1024
+MAJOR_WEIGHT = 2
+
+
+def conflict_edges(severity_matrix, row_block=ROW_BLOCK):
+    """(edges (E, 2) with i < j, severity (E,)) for every nonzero cell above the diagonal."""
+    if isinstance(severity_matrix, PackedSeverity):
+        rows, cols, levels = severity_matrix.upper_nonzero()
+        return np.stack([rows, cols], axis=1).astype(np.intp), levels.astype(np.int8)
+    size = len(severity_matrix)
+    edges, levels = [], []
+    for start in range(0, size, row_block):
+        block = np.asarray(severity_matrix[start:start + row_block])
+        rows, cols = np.nonzero(block)
+        rows += start
+        upper = cols > rows
+        edges.append(np.stack([rows[upper], cols[upper]], axis=1))
+        levels.append(block[rows[upper] - start, cols[upper]])
+    if not edges:
+        return np.empty((0, 2), dtype=np.intp), np.empty(0, dtype=np.int8)
+    return np.concatenate(edges).astype(np.intp), np.concatenate(levels).astype(np.int8)
+
+
+@dataclass(frozen=True)
+class ConflictGraph:
+    excipient_list: list
+    edges: np.ndarray  # (E, 2) excipient ids, i < j
+    severity: np.ndarray  # (E,) 1 = Minor, 2 = Major
+    major: np.ndarray  # per excipient
+    minor: np.ndarray  # per excipient
+
+    @property
+    def degree(self):
+        return self.major + self.minor
+
+    @property
+    def risk(self):
+        return MAJOR_WEIGHT * self.major + self.minor
+
+    @cached_property
+    def graph(self):
+        graph = nx.Graph()
+        graph.add_nodes_from(range(len(self.excipient_list)))
+        graph.add_weighted_edges_from(zip(self.edges[:, 0].tolist(), self.edges[:, 1].tolist(), self.severity.tolist()))
+        return graph
+
+    def order(self):
+        """Excipient ids from least to most risky (ties by name)."""
+        return np.lexsort((np.arange(len(self.excipient_list)), self.risk))
+
+    def clusters(self, kind="components"):
+        """Groups of conflicting excipients, largest first, singletons left out.
+
+        "components" are the connected components of the conflict graph; "communities"
+        are Louvain communities (severity-weighted), which split a large component into
+        densely conflicting groups. Communities are the expensive part at 10k excipients.
+        """
+        if kind == "components":
+            groups = nx.connected_components(self.graph)
+        else:
+            groups = nx.community.louvain_communities(self.graph, weight="weight", seed=0)
+        groups = [sorted(group) for group in groups if len(group) > 1]
+        groups.sort(key=lambda group: (-len(group), group[0]))
+        return [[self.excipient_list[i] for i in group] for group in groups]
+
+    def profiles(self):
+        """One row per excipient: Major/Minor/total conflicts, risk score and share of the grid."""
+        others = max(len(self.excipient_list) - 1, 1)
+        return pd.DataFrame({
+            "Excipient": self.excipient_list,
+            "Major": self.major,
+            "Minor": self.minor,
+            "Conflicts": self.degree,
+            "Risk": self.risk,
+            "Conflicts with (%)": np.round(100 * self.degree / others, 1),
+        })
+
+    def hubs(self, limit=10):
+        """The `limit` most risky excipients."""
+        profiles = self.profiles()
+        top = self.order()[::-1][:limit]
+        return profiles.iloc[top[self.risk[top] > 0]].reset_index(drop=True)
+
+
+def build_conflict_graph(kb):
+    edges, severity = conflict_edges(kb.severity_matrix)
+    size = len(kb.excipient_list)
+    is_major = severity == 2
+    major = np.bincount(edges[is_major].ravel(), minlength=size)
+    minor = np.bincount(edges[~is_major].ravel(), minlength=size)
+    return ConflictGraph(
+        excipient_list=kb.excipient_list,
+        edges=edges,
+        severity=severity,
+        major=major,
+        minor=minor,
+    )
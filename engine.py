@@ -0,0 +1,296 @@
+"""Headless compatibility engine: pairwise checks over the knowledge-base severity matrix.
+
+No Streamlit import, so it can be used from scripts, batch jobs and services:
+
+    import engine
+    result = engine.check_many([["Acetone", "Sodium Benzoate"], ["Ascorbic Acid", "Calcium Carbonate"]])
+    result.worst, result.issues, result.throughput
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+import knowledge_base
+
+SEVERITY_LABELS = {2: "Major", 1: "Minor"}
+COMPATIBLE = "Compatible"
+NO_EXPLANATION = "No detailed explanation available for this specific incompatibility."
+
+# Upper bound on gathered pair cells per batch chunk (int8 levels plus intp ids), keeps memory flat.
+MAX_CHUNK_PAIRS = 1 << 22
+
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL = 3600  # seconds
+
+
+def get_excipient_ids(excipients, excipient_ids):
+    """Stripped names that exist in the grid, and their ids, in input order."""
+    names = [e.strip() for e in excipients]
+    names = [n for n in names if n in excipient_ids]
+    ids = np.fromiter((excipient_ids[n] for n in names), dtype=np.intp, count=len(names))
+    return names, ids
+
+
+def severity_submatrix(excipients, kb):
+    """Severity matrix for the given excipients, in the given order (unknown names are compatible)."""
+    size = len(excipients)
+    matrix = np.zeros((size, size), dtype=np.int8)
+    positions = [i for i, e in enumerate(excipients) if e.strip() in kb.excipient_ids]
+    ids = np.array([kb.excipient_ids[excipients[i].strip()] for i in positions], dtype=np.intp)
+    matrix[np.ix_(positions, positions)] = kb.severity_matrix[np.ix_(ids, ids)]
+    return matrix
+
+
+def check_compatibility(excipients, kb):
+    """[(sorted pair, "Major"/"Minor"), ...] in combinations() order of the input."""
+    names, ids = get_excipient_ids(excipients, kb.excipient_ids)
+    rows, cols = np.triu_indices(len(ids), k=1)
+    levels = kb.severity_matrix[ids[rows], ids[cols]]
+    issues = []
+    for k in np.flatnonzero(levels):
+        pair = tuple(sorted([names[rows[k]], names[cols[k]]]))
+        issues.append((pair, SEVERITY_LABELS[int(levels[k])]))
+    return issues
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of check results, keyed by formulation signature.
+
+    When the knowledge base is hot-reloaded, `apply_diff` carries over every entry the
+    change cannot affect and drops only the ones containing a changed excipient. Without a
+    diff, a lookup for an unknown version clears the cache, so a changed grid workbook
+    still invalidates it by itself. Lookups for a retired version simply miss.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        version = key[1]
+        with self._lock:
+            if version in self._retired:
+                self.misses += 1
+                return None
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            if key[1] != self._version:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def apply_diff(self, diff, old_kb, new_kb):
+        """Re-keys the entries of `diff.old_version` that the change leaves valid to `diff.new_version`.
+
+        Returns (entries kept, entries dropped).
+        """
+        touched = diff.touched_excipients
+        kept = dropped = 0
+        with self._lock:
+            if self._version != diff.old_version:
+                self._entries.clear()
+            else:
+                entries, self._entries = self._entries, OrderedDict()
+                for (ids, _), value in entries.items():
+                    names = [old_kb.excipient_list[i] for i in ids]
+                    if touched.intersection(names):
+                        dropped += 1
+                        continue
+                    # Ids can shift when excipients are added or removed; names cannot.
+                    new_ids = tuple(sorted(new_kb.excipient_ids[n] for n in names))
+                    self._entries[(new_ids, diff.new_version)] = value
+                    kept += 1
+            self._retired.add(diff.old_version)
+            self._retired.discard(diff.new_version)
+            self._version = diff.new_version
+        return kept, dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+RESULT_CACHE = ResultCache()
+
+
+def formulation_signature(excipients, kb):
+    """Canonical cache key: sorted ids of the known excipients plus the knowledge-base version."""
+    _, ids = get_excipient_ids(excipients, kb.excipient_ids)
+    return tuple(sorted(set(ids.tolist()))), kb.version
+
+
+def check_compatibility_cached(excipients, kb, cache=RESULT_CACHE):
+    """check_compatibility through the process-wide result cache.
+
+    Issues come back in canonical (sorted) order, so the same set of excipients gives
+    the same result whatever order it was selected in.
+    """
+    key = formulation_signature(excipients, kb)
+    issues = cache.get(key)
+    if issues is None:
+        issues = tuple(check_compatibility([kb.excipient_list[i] for i in key[0]], kb))
+        cache.put(key, issues)
+    return list(issues)
+
+
+class IncrementalChecker:
+    """Keeps the issues of a changing selection up to date by applying deltas.
+
+    Adding an excipient gathers one row of the severity matrix against the current
+    members (O(N)); removing one drops only the issues that involve it.
+    """
+
+    def __init__(self, kb):
+        self.kb = kb
+        self._members = {}  # name -> id, in insertion order
+        self._issues = {}  # sorted pair -> "Major"/"Minor", in discovery order
+        self._by_member = {}  # name -> pairs involving it
+
+    @property
+    def excipients(self):
+        return list(self._members)
+
+    @property
+    def issues(self):
+        return list(self._issues.items())
+
+    def add(self, excipient):
+        name = excipient.strip()
+        if name in self._members or name not in self.kb.excipient_ids:
+            return
+        new_id = self.kb.excipient_ids[name]
+        self._by_member[name] = set()
+        if self._members:
+            names = list(self._members)
+            levels = self.kb.severity_matrix[new_id, np.fromiter(self._members.values(), dtype=np.intp, count=len(names))]
+            for k in np.flatnonzero(levels):
+                pair = tuple(sorted([names[k], name]))
+                self._issues[pair] = SEVERITY_LABELS[int(levels[k])]
+                self._by_member[name].add(pair)
+                self._by_member[names[k]].add(pair)
+        self._members[name] = new_id
+
+    def remove(self, excipient):
+        name = excipient.strip()
+        if name not in self._members:
+            return
+        del self._members[name]
+        for pair in self._by_member.pop(name):
+            del self._issues[pair]
+            other = pair[0] if pair[1] == name else pair[1]
+            self._by_member[other].discard(pair)
+
+    def update(self, excipients):
+        """Moves to the selection `excipients` with the fewest adds/removes; returns the issues."""
+        wanted = dict.fromkeys(e.strip() for e in excipients)
+        for name in [n for n in self._members if n not in wanted]:
+            self.remove(name)
+        for name in wanted:
+            self.add(name)
+        return self.issues
+
+
+def worst_severity(issues):
+    """"Major", "Minor" or "Compatible" for a list of issues from check_compatibility."""
+    labels = {severity for _, severity in issues}
+    return "Major" if "Major" in labels else "Minor" if "Minor" in labels else COMPATIBLE
+
+
+@dataclass
+class BatchResult:
+    worst: np.ndarray  # int8 per formulation: 0 compatible, 1 minor, 2 major
+    issues: list  # per formulation, same format as check_compatibility
+    seconds: float
+
+    def __len__(self):
+        return len(self.worst)
+
+    @property
+    def throughput(self):
+        """Formulations per second."""
+        return len(self.worst) / self.seconds if self.seconds else float("inf")
+
+    def worst_label(self, i):
+        return SEVERITY_LABELS.get(int(self.worst[i]), COMPATIBLE)
+
+
+def _check_chunk(chunk, width, lengths, resolved, severity_matrix, worst, issues):
+    rows, cols = np.triu_indices(width, k=1)
+    ids = np.zeros((len(chunk), width), dtype=np.intp)
+    for r, f in enumerate(chunk):
+        ids[r, :lengths[f]] = resolved[f][1]
+
+    levels = severity_matrix[ids[:, rows], ids[:, cols]]
+    # Rows are padded at the end, so a pair is real iff its higher position is inside the row.
+    levels[cols[None, :] >= lengths[chunk][:, None]] = 0
+    worst[chunk] = levels.max(axis=1)
+
+    hit_rows, hit_pairs = np.nonzero(levels)
+    for r, k in zip(hit_rows.tolist(), hit_pairs.tolist()):
+        names = resolved[chunk[r]][0]
+        pair = tuple(sorted([names[rows[k]], names[cols[k]]]))
+        issues[chunk[r]].append((pair, SEVERITY_LABELS[int(levels[r, k])]))
+
+
+def check_many(formulations, kb=None, max_chunk_pairs=MAX_CHUNK_PAIRS):
+    """Checks a batch of formulations (iterables of excipient names) with vectorized submatrix gathers.
+
+    Formulations are sorted by size and gathered in chunks of similar width, so padding
+    and peak memory stay bounded regardless of batch size.
+    """
+    kb = kb or knowledge_base.load()
+    start = time.perf_counter()
+
+    resolved = [get_excipient_ids(f, kb.excipient_ids) for f in formulations]
+    count = len(resolved)
+    lengths = np.fromiter((len(ids) for _, ids in resolved), dtype=np.intp, count=count)
+    worst = np.zeros(count, dtype=np.int8)
+    issues = [[] for _ in range(count)]
+
+    order = np.argsort(lengths, kind="stable")
+    pos = int(np.searchsorted(lengths[order], 2))  # fewer than two known excipients: nothing to check
+    while pos < count:
+        width = int(lengths[order[pos]])
+        end = min(count, pos + max(1, max_chunk_pairs // (width * (width - 1) // 2)))
+        width = int(lengths[order[end - 1]])
+        while end - pos > 1 and (end - pos) * (width * (width - 1) // 2) > max_chunk_pairs:
+            end = pos + (end - pos) // 2
+            width = int(lengths[order[end - 1]])
+        _check_chunk(order[pos:end], width, lengths, resolved, kb.severity_matrix, worst, issues)
+        pos = end
+
+    return BatchResult(worst=worst, issues=issues, seconds=time.perf_counter() - start)
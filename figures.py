@@ -0,0 +1,51 @@
+"""Adjacency-matrix rendering for the results page and the PDF report.
+
+Figures are built with the object-oriented Figure API instead of pyplot, so nothing is
+registered in pyplot's global figure list and each figure is freed with its last
+reference. With the non-interactive Agg backend, separate figures can be rendered on
+worker threads concurrently (render_pool.RenderPool).
+"""
+from io import BytesIO
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import seaborn as sns  # noqa: E402
+from matplotlib.colors import ListedColormap  # noqa: E402
+from matplotlib.figure import Figure  # noqa: E402
+
+# Compatible, Minor, Major, and the greyed-out lower triangle.
+MATRIX_COLOURS = ["#88e388", "#FFD700", "#FF4C4C", "#D3D3D3"]
+_LOWER_TRIANGLE = 3
+
+
+def matrix_figure(excipients, matrix, figsize=(7.5, 7)):
+    """Upper-triangle severity heatmap; the lower triangle is drawn grey in the same pass."""
+    display = np.array(matrix, dtype=np.int8)
+    display[np.tril_indices(len(excipients))] = _LOWER_TRIANGLE
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    sns.heatmap(display,
+                cmap=ListedColormap(MATRIX_COLOURS),
+                square=True,
+                linewidths=0.5,
+                linecolor='gray',
+                xticklabels=excipients,
+                yticklabels=excipients,
+                cbar=False,
+                annot=False,
+                vmin=0, vmax=_LOWER_TRIANGLE,
+                ax=ax)
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right', fontsize=9, fontweight='bold')
+    ax.set_yticklabels(ax.get_yticklabels(), rotation=0, fontsize=9, fontweight='bold')
+    fig.tight_layout()
+    return fig
+
+
+def matrix_png(excipients, matrix, dpi=100):
+    buffer = BytesIO()
+    matrix_figure(excipients, matrix).savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
+    return buffer.getvalue()
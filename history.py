@@ -0,0 +1,129 @@
+"""Persistent formulation history in SQLite.
+
+Each entry keeps the excipient list, the check result (pairwise issues, the conditions
+selected and the multi-excipient rules they triggered) and the knowledge-base version it
+was computed against, so reloading an entry is a primary-key lookup and only re-runs the
+check if the knowledge base has changed since. Entries are scoped by an owner key and
+read a page at a time. Databases written before conditions and rule matches were stored
+gain the columns on open; their entries load with `rule_matches` None.
+"""
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+from rules import Rule, RuleMatch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS formulations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    excipients TEXT NOT NULL,
+    issues TEXT NOT NULL,
+    kb_version TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    conditions TEXT NOT NULL DEFAULT '[]',
+    rule_matches TEXT
+);
+CREATE INDEX IF NOT EXISTS formulations_by_owner ON formulations (owner, id DESC);
+"""
+
+_COLUMNS = "id, name, excipients, issues, kb_version, created_at, conditions, rule_matches"
+_ADDED_COLUMNS = {"conditions": "TEXT NOT NULL DEFAULT '[]'", "rule_matches": "TEXT"}
+
+
+def _rule_match_records(rule_matches):
+    return [
+        [m.rule.rule_id, list(m.rule.excipients), m.rule.min_present, m.rule.condition, m.rule.severity,
+         m.rule.rationale, list(m.present)]
+        for m in rule_matches
+    ]
+
+
+def _rule_matches(records):
+    return [
+        RuleMatch(Rule(rule_id, tuple(names), min_present, condition, severity, rationale), tuple(present))
+        for rule_id, names, min_present, condition, severity, rationale, present in records
+    ]
+
+
+def _entry(row):
+    id_, name, excipients, issues, kb_version, created_at, conditions, rule_matches = row
+    return {
+        "id": id_,
+        "name": name,
+        "excipients": json.loads(excipients),
+        "issues": [((a, b), severity) for a, b, severity in json.loads(issues)],
+        "kb_version": kb_version,
+        "created_at": created_at,
+        "conditions": json.loads(conditions),
+        "rule_matches": _rule_matches(json.loads(rule_matches)) if rule_matches is not None else None,
+    }
+
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            existing = {column for _, column, *_ in db.execute("PRAGMA table_info(formulations)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    db.execute(f"ALTER TABLE formulations ADD COLUMN {column} {definition}")
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit serves sessions from many threads.
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, owner, excipients, issues, kb_version, name=None, conditions=(), rule_matches=()):
+        with closing(self._connect()) as db, db:
+            if name is None:
+                (count,) = db.execute("SELECT COUNT(*) FROM formulations WHERE owner = ?", (owner,)).fetchone()
+                name = f"Formulation {count + 1}"
+            cursor = db.execute(
+                "INSERT INTO formulations (owner, name, excipients, issues, kb_version, created_at, conditions, rule_matches)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    owner,
+                    name,
+                    json.dumps(list(excipients), ensure_ascii=False),
+                    json.dumps([[a, b, severity] for (a, b), severity in issues], ensure_ascii=False),
+                    kb_version,
+                    datetime.now().isoformat(timespec="seconds"),
+                    json.dumps(list(conditions), ensure_ascii=False),
+                    json.dumps(_rule_match_records(rule_matches), ensure_ascii=False),
+                ),
+            )
+            return cursor.lastrowid
+
+    def get(self, owner, formulation_id):
+        with closing(self._connect()) as db:
+            row = db.execute(
+                f"SELECT {_COLUMNS} FROM formulations WHERE id = ? AND owner = ?", (formulation_id, owner)
+            ).fetchone()
+        return _entry(row) if row else None
+
+    def rename(self, owner, formulation_id, name):
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE formulations SET name = ? WHERE id = ? AND owner = ?", (name, formulation_id, owner))
+
+    def delete(self, owner, formulation_id):
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM formulations WHERE id = ? AND owner = ?", (formulation_id, owner))
+
+    def page(self, owner, page=0, page_size=10, search=""):
+        """(entries on `page`, newest first, total matching entries). `search` matches names and excipients."""
+        where, params = "owner = ?", [owner]
+        if search:
+            where += " AND (name LIKE ? ESCAPE '\\' OR excipients LIKE ? ESCAPE '\\')"
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params += [pattern, pattern]
+        with closing(self._connect()) as db:
+            (total,) = db.execute(f"SELECT COUNT(*) FROM formulations WHERE {where}", params).fetchone()
+            rows = db.execute(
+                f"SELECT {_COLUMNS} FROM formulations WHERE {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [page_size, page * page_size],
+            ).fetchall()
+        return [_entry(row) for row in rows], total
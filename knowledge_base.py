@@ -0,0 +1,358 @@
+"""Loading of the excipient knowledge base (descriptions, explanations, incompatibility grid, rules, synonyms).
+
+The workbooks in data/ are slow to parse with openpyxl, so the parsed result can
+be written to a binary snapshot (upper triangle of the severity matrix as .npy plus a
+JSON name/text table) tagged with a hash of the source workbooks. `load` uses the
+snapshot when its hash matches the workbooks and falls back to Excel otherwise.
+
+Explanations are held in a compact.ExplanationTable (integer pair keys into a table of
+distinct texts). Grids of COMPACT_MIN_EXCIPIENTS or more also keep the severity matrix
+packed (compact.PackedSeverity, half the bytes); smaller ones use the dense array.
+
+    python knowledge_base.py build-snapshot
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from compact import ExplanationTable, PackedSeverity
+from normalize import NameIndex, load_synonyms
+from rules import RuleSet, load_rules
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DESCRIPTIONS_FILE = os.path.join(DATA_DIR, "Excipient Descriptions.xlsx")
+EXPLANATIONS_FILE = os.path.join(DATA_DIR, "Excipient Incapability Explanation.xlsx")
+GRID_FILE = os.path.join(DATA_DIR, "Excipient Incompatibilty Grid.xlsx")
+RULES_FILE = os.path.join(DATA_DIR, "Excipient Interaction Rules.xlsx")  # optional
+SYNONYMS_FILE = os.path.join(DATA_DIR, "Excipient Synonyms.xlsx")  # optional
+KNOWLEDGE_BASE_FILES = (DESCRIPTIONS_FILE, EXPLANATIONS_FILE, GRID_FILE, RULES_FILE, SYNONYMS_FILE)
+
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshot")
+SNAPSHOT_MATRIX = "severity-{version}.npy"  # one file per version, named by the tables
+SNAPSHOT_TABLES = "knowledge_base.json"
+SNAPSHOT_FORMAT = 5
+COMPACT_MIN_EXCIPIENTS = 2000
+DIFF_ROW_BLOCK = 256  # rows of the severity matrix compared per step in `diff`
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    descriptions: dict
+    explanations: dict
+    severity_matrix: np.ndarray
+    excipient_ids: dict
+    excipient_list: list
+    version: str
+    load_seconds: float
+    source: str = "excel"
+    messages: tuple = ()
+    rules: RuleSet = field(default_factory=RuleSet)
+    synonyms: dict = field(default_factory=dict)
+
+    @cached_property
+    def name_index(self):
+        """Free-text name resolver over the grid names and synonyms, built on first use."""
+        return NameIndex(self.excipient_list, self.synonyms)
+
+
+def source_signature(paths=KNOWLEDGE_BASE_FILES):
+    """(path, mtime, size) of each source workbook; cheap enough to compute on every rerun."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def content_hash(paths=KNOWLEDGE_BASE_FILES):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+# --- Excel ---
+def load_descriptions(path=DESCRIPTIONS_FILE):
+    desc_df = pd.read_excel(path)
+    desc_df.columns = desc_df.columns.str.strip()
+    return dict(zip(desc_df['Excipient'].str.strip(), desc_df['Description'].str.strip()))
+
+
+def load_explanations(path=EXPLANATIONS_FILE):
+    """Returns ({sorted pair: rationale}, messages); problems are reported, not raised."""
+    try:
+        explanation_df = pd.read_excel(path)
+        explanation_df.columns = explanation_df.columns.str.strip()
+        excipient1 = explanation_df['Excipient1'].astype(str).str.strip()
+        excipient2 = explanation_df['Excipient2'].astype(str).str.strip()
+        rationale = explanation_df['Rationale'].astype(str).str.strip()
+    except FileNotFoundError:
+        return {}, (("error", f"Error: The file '{path}' was not found. Please ensure it's in the same directory as your script."),)
+    except KeyError as e:
+        return {}, (("error", f"Error reading '{path}': Missing expected column. Please ensure it has 'Excipient1', 'Excipient2', and 'Rationale' columns. Detail: {e}"),)
+
+    explanations = {}
+    for a, b, text in zip(excipient1, excipient2, rationale):
+        explanations[tuple(sorted([a, b]))] = text
+    return explanations, ()
+
+
+def load_grid(path=GRID_FILE):
+    df = pd.read_excel(path, index_col=0)
+    df.index = df.index.str.strip()
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def build_incompatibility_index(df):
+    """Compiles the grid into a symmetric int8 severity matrix (0/1/2) and an excipient -> id map."""
+    names = sorted(set(df.index) | set(df.columns))
+    grid = df.reindex(index=names, columns=names)
+    values = grid.apply(pd.to_numeric, errors="coerce").to_numpy()
+    severity = np.where(np.isin(values, (1, 2)), values, 0).astype(np.int8)
+    severity = np.maximum(severity, severity.T)
+    excipient_ids = {name: i for i, name in enumerate(names)}
+    return severity, excipient_ids
+
+
+def compact_severity(matrix):
+    """The packed form of a dense severity matrix for large grids; small ones stay dense."""
+    if len(matrix) >= COMPACT_MIN_EXCIPIENTS and not isinstance(matrix, PackedSeverity):
+        return PackedSeverity.from_dense(matrix)
+    return matrix
+
+
+def load_from_excel(version=None):
+    start = time.perf_counter()
+    version = version or content_hash()
+    descriptions = load_descriptions()
+    explanations, messages = load_explanations()
+    severity_matrix, excipient_ids = build_incompatibility_index(load_grid())
+    rule_set, rule_messages = load_rules(RULES_FILE)
+    synonyms, synonym_messages = load_synonyms(SYNONYMS_FILE)
+    return KnowledgeBase(
+        descriptions=descriptions,
+        explanations=ExplanationTable.from_pairs(explanations, excipient_ids),
+        severity_matrix=compact_severity(severity_matrix),
+        excipient_ids=excipient_ids,
+        excipient_list=list(excipient_ids),
+        version=version,
+        load_seconds=time.perf_counter() - start,
+        source="excel",
+        messages=messages + rule_messages + synonym_messages,
+        rules=rule_set,
+        synonyms=synonyms,
+    )
+
+
+# --- Snapshot ---
+def write_snapshot(kb, snapshot_dir=SNAPSHOT_DIR):
+    """Writes the matrix under a version-named file, then swaps in the tables that name it.
+
+    The tables file is the only one replaced in place, so a reader gets either the old
+    tables and old matrix or the new tables and new matrix. The matrix the old tables named
+    is removed afterwards; a reader that still holds the old tables then fails to open its
+    matrix and falls back to the workbooks instead of mixing versions.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    matrix_name = SNAPSHOT_MATRIX.format(version=kb.version[:16])
+    matrix_path = os.path.join(snapshot_dir, matrix_name)
+    tables_path = os.path.join(snapshot_dir, SNAPSHOT_TABLES)
+    packed = kb.severity_matrix
+    if not isinstance(packed, PackedSeverity):
+        packed = PackedSeverity.from_dense(np.asarray(packed))
+    texts, text_index, explanations = [], {}, []
+    for (a, b), text in kb.explanations.items():
+        if text not in text_index:
+            text_index[text] = len(texts)
+            texts.append(text)
+        explanations.append([a, b, text_index[text]])
+    tables = {
+        "format": SNAPSHOT_FORMAT,
+        "version": kb.version,
+        "matrix": matrix_name,
+        "excipients": kb.excipient_list,
+        "descriptions": kb.descriptions,
+        "explanation_texts": texts,
+        "explanations": explanations,
+        "rules": kb.rules.to_records(),
+        "synonyms": kb.synonyms,
+    }
+
+    # Only the matrix the replaced tables named is removed, never one another writer just published.
+    try:
+        with open(tables_path, encoding="utf-8") as f:
+            previous_matrix = os.path.basename(json.load(f).get("matrix", ""))
+    except (OSError, ValueError, AttributeError):
+        previous_matrix = None
+    # Unique temp files: app processes, the API and the reloader thread may write at the same time.
+    matrix_fd, matrix_tmp = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+    tables_fd, tables_tmp = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+    try:
+        with os.fdopen(matrix_fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(packed.data, dtype=np.int8))
+        with os.fdopen(tables_fd, "w", encoding="utf-8") as f:
+            json.dump(tables, f, ensure_ascii=False)
+        os.replace(matrix_tmp, matrix_path)
+        os.replace(tables_tmp, tables_path)
+    finally:
+        for path in (matrix_tmp, tables_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    if previous_matrix and previous_matrix != matrix_name:
+        try:
+            os.remove(os.path.join(snapshot_dir, previous_matrix))
+        except OSError:
+            pass
+
+
+def load_snapshot(version=None, snapshot_dir=SNAPSHOT_DIR, mmap=True):
+    """Returns the snapshot KnowledgeBase, or None if it is missing, unreadable or stale.
+
+    The matrix is the file the tables name, so tables and matrix always come from the same write.
+    """
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(snapshot_dir, SNAPSHOT_TABLES), encoding="utf-8") as f:
+            tables = json.load(f)
+        if tables.get("format") != SNAPSHOT_FORMAT:
+            return None
+        if version is not None and tables.get("version") != version:
+            return None
+        matrix_name = os.path.basename(tables["matrix"])
+        packed = np.load(os.path.join(snapshot_dir, matrix_name), mmap_mode="r" if mmap else None)
+        names = tables["excipients"]
+        severity_matrix = PackedSeverity(packed, len(names))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if len(names) < COMPACT_MIN_EXCIPIENTS:
+        severity_matrix = np.asarray(severity_matrix)
+    excipient_ids = {name: i for i, name in enumerate(names)}
+    texts = tables["explanation_texts"]
+    return KnowledgeBase(
+        descriptions=tables["descriptions"],
+        explanations=ExplanationTable.from_pairs(((a, b, texts[k]) for a, b, k in tables["explanations"]), excipient_ids),
+        severity_matrix=severity_matrix,
+        excipient_ids=excipient_ids,
+        excipient_list=names,
+        version=tables["version"],
+        load_seconds=time.perf_counter() - start,
+        source="snapshot",
+        rules=RuleSet.from_records(tables["rules"]),
+        synonyms=tables["synonyms"],
+    )
+
+
+def load(version=None, use_snapshot=True, refresh_snapshot=True):
+    """Loads from a fresh snapshot if there is one, otherwise from Excel (optionally re-writing the snapshot)."""
+    version = version or content_hash()
+    if use_snapshot:
+        kb = load_snapshot(version)
+        if kb is not None:
+            return kb
+
+    kb = load_from_excel(version)
+    if refresh_snapshot and not kb.messages:
+        try:
+            write_snapshot(kb)
+        except OSError:
+            pass  # read-only data dir; keep serving from Excel
+    return kb
+
+
+# --- Versions ---
+@dataclass(frozen=True)
+class KnowledgeBaseDiff:
+    old_version: str
+    new_version: str
+    changed_pairs: list  # [(sorted pair, old level, new level)] for excipients in both versions
+    added: list  # excipient names
+    removed: list
+    changed_explanations: list  # sorted pairs whose rationale text was added, removed or edited
+    rules_changed: bool = False  # any multi-excipient rule added, removed or edited
+
+    @property
+    def touched_excipients(self):
+        """Names whose cached results may be stale: ends of changed pairs plus added/removed excipients."""
+        return {name for pair, _, _ in self.changed_pairs for name in pair} | set(self.added) | set(self.removed)
+
+    def summary(self):
+        parts = []
+        if self.changed_pairs:
+            parts.append(f"{len(self.changed_pairs)} pair(s) changed severity")
+        if self.added:
+            parts.append(f"{len(self.added)} excipient(s) added")
+        if self.removed:
+            parts.append(f"{len(self.removed)} excipient(s) removed")
+        if self.changed_explanations:
+            parts.append(f"{len(self.changed_explanations)} explanation(s) edited")
+        if self.rules_changed:
+            parts.append("rules edited")
+        return ", ".join(parts) or "no grid, explanation or rule changes"
+
+
+def diff(old, new):
+    """What changed between two knowledge bases, compared by excipient name."""
+    common = [name for name in old.excipient_list if name in new.excipient_ids]
+    old_ids = np.array([old.excipient_ids[n] for n in common], dtype=np.intp)
+    new_ids = np.array([new.excipient_ids[n] for n in common], dtype=np.intp)
+    labels = {0: "Compatible", 1: "Minor", 2: "Major"}
+    same_ids = old.excipient_list == new.excipient_list
+    changed_pairs = []
+    for start in range(0, len(common), DIFF_ROW_BLOCK):  # row blocks: no N x N temporaries
+        block = slice(start, start + DIFF_ROW_BLOCK)
+        if same_ids:
+            before, after = np.asarray(old.severity_matrix[block]), np.asarray(new.severity_matrix[block])
+        else:
+            before = old.severity_matrix[old_ids[block, None], old_ids[None, :]]
+            after = new.severity_matrix[new_ids[block, None], new_ids[None, :]]
+        rows, cols = np.nonzero(before != after)
+        upper = cols > rows + start
+        changed_pairs.extend(
+            (tuple(sorted([common[start + i], common[j]])), labels[int(before[i, j])], labels[int(after[i, j])])
+            for i, j in zip(rows[upper].tolist(), cols[upper].tolist())
+        )
+    before, after = dict(old.explanations.items()), dict(new.explanations.items())
+    return KnowledgeBaseDiff(
+        old_version=old.version,
+        new_version=new.version,
+        changed_pairs=changed_pairs,
+        added=[n for n in new.excipient_list if n not in old.excipient_ids],
+        removed=[n for n in old.excipient_list if n not in new.excipient_ids],
+        changed_explanations=sorted(p for p in before.keys() | after.keys() if before.get(p) != after.get(p)),
+        rules_changed=old.rules.to_records() != new.rules.to_records(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary snapshot of the excipient knowledge base.")
+    parser.add_argument("command", choices=["build-snapshot"])
+    parser.add_argument("--output", default=SNAPSHOT_DIR, help="snapshot directory (default: data/snapshot)")
+    args = parser.parse_args()
+
+    kb = load_from_excel()
+    for _, message in kb.messages:
+        print(message)
+    write_snapshot(kb, args.output)
+    print(f"Wrote snapshot {kb.version[:12]} ({len(kb.excipient_list)} excipients) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,46 @@
 import streamlit as st
 import pandas as pd
-from itertools import combinations
 import streamlit as st
 from streamlit.components.v1 import html
-from datetime import datetime
 import networkx as nx
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Image
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from io import BytesIO
-import tempfile
+import os
+import threading
+import time
+import uuid
+
+import bulk
+import compatible_sets
+import conflict_graph
+import engine
+import figures
+import history
+import knowledge_base
+import matrix_view
+import perf
+import recommend
+import reloader
+import render
+import render_pool
+import report
 
 st.set_page_config(page_title="Excipient Match Maker", layout="wide")
 
-if "formulation_history" not in st.session_state:
-    st.session_state.formulation_history = []
+# Stage timings are off unless the page is opened with ?debug=perf (panel in the sidebar)
+# or EXCIPIENT_PERF_LOG names a JSON-lines file to append every rerun to.
+PERF_LOG = os.environ.get("EXCIPIENT_PERF_LOG")
+PERF_HISTORY_SIZE = 50
+show_perf_panel = st.query_params.get("debug") == "perf"
+perf_timer = perf.RerunTimer(enabled=show_perf_panel, log_path=PERF_LOG)
 
-if "formulation_counter" not in st.session_state:
-    st.session_state.formulation_counter = 0
+if "renaming_id" not in st.session_state:
+    st.session_state.renaming_id = None
+
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
 
 
 
@@ -66,268 +88,290 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Tooltip styles for the excipient tags and incompatibility labels, sent once per page.
+st.markdown(render.TOOLTIP_CSS, unsafe_allow_html=True)
+
 # --- Teal banner ---
 st.markdown('<div class="top-banner">Excipient Match Maker</div>', unsafe_allow_html=True)
 
 
-# Load Excipient Descriptions from Excel
-desc_df = pd.read_excel("data/Excipient Descriptions.xlsx")
+# Formulations larger than this open the adjacency matrix in the interactive view.
+INTERACTIVE_MATRIX_THRESHOLD = 30
 
-# Strip whitespace and create dictionary for lookup
-desc_df.columns = desc_df.columns.str.strip()
-desc_df['Excipient'] = desc_df['Excipient'].str.strip()
-desc_df['Description'] = desc_df['Description'].str.strip()
+HISTORY_DB = os.environ.get("EXCIPIENT_HISTORY_DB", os.path.join(knowledge_base.DATA_DIR, "history.db"))
+HISTORY_PAGE_SIZE = 10
 
-excipient_descriptions = dict(zip(desc_df['Excipient'], desc_df['Description']))
+BULK_WORKERS = 2  # uploads evaluated at once across all sessions; further uploads queue
+BULK_REFRESH_SECONDS = 1
+ANALYTICS_PAGE_SIZE = 50  # excipient profiles per page
+ANALYTICS_CLUSTERS = 20  # largest clusters listed
+ANALYTICS_CLUSTER_NAMES = 30  # names listed per cluster
+RENDER_REFRESH_SECONDS = 0.5
+SUBSET_CACHE_SIZE = 256  # complete subset searches kept across sessions
 
-explanation_file = "data/Excipient Incapability Explanation.xlsx"
+# --- Knowledge base ---
+@st.cache_resource(show_spinner="Loading excipient knowledge base...")
+def get_knowledge_base_watcher():
+    """Shared across sessions. Edited workbooks are rebuilt on a background thread and swapped in;
+    cached check results the edit cannot affect are kept."""
+    perf_timer.miss("knowledge base")
+    return reloader.KnowledgeBaseWatcher(on_reload=[engine.RESULT_CACHE.apply_diff]).start()
 
-try:
-    explanation_df = pd.read_excel(explanation_file)
-    explanation_df.columns = explanation_df.columns.str.strip()
 
-    incompatibility_explanations = {}
-    for _, row in explanation_df.iterrows():
-        try:
-            excipient1 = str(row['Excipient1']).strip()
-            excipient2 = str(row['Excipient2']).strip()
-            rationale = str(row['Rationale']).strip()
-            pair = tuple(sorted([excipient1, excipient2]))
-            incompatibility_explanations[pair] = rationale
-        except KeyError as e:
-            st.warning(f"Skipping row due to missing column: {e}")
-except FileNotFoundError:
-    st.error(f"Error: The file '{explanation_file}' was not found. Please ensure it's in the same directory as your script.")
-    incompatibility_explanations = {}
-except KeyError as e:
-    st.error(f"Error reading '{explanation_file}': Missing expected column. Please ensure it has 'Excipient1', 'Excipient2', and 'Rationale' columns. Detail: {e}")
-    incompatibility_explanations = {}
+# Taken once per rerun: a reload during this rerun does not change what it shows.
+with perf_timer.stage("knowledge base", cached=True):
+    kb_watcher = get_knowledge_base_watcher()
+    kb = kb_watcher.current
+for level, message in kb.messages:
+    getattr(st, level)(message)
 
+excipient_descriptions = kb.descriptions
+incompatibility_explanations = kb.explanations
+excipient_list = kb.excipient_list
 
-def get_hover_html(excipient):
-    desc = excipient_descriptions.get(excipient, "No description available.")
-    return f"""
-    <style>
-    .tooltip {{
-        position: relative;
-        display: inline-block;
-        cursor: pointer;
-        margin: 4px;
-    }}
-    .tooltip .tooltiptext {{
-        visibility: hidden;
-        width: 250px;
-        background-color: #f9f9f9;
-        color: #333;
-        text-align: left;
-        border: 1px solid #ccc;
-        border-radius: 8px;
-        padding: 10px;
-        position: absolute;
-        z-index: 1;
-        bottom: 125%;
-        left: 50%;
-        transform: translateX(-50%);
-        opacity: 0;
-        transition: opacity 0.3s;
-        box-shadow: 0px 2px 8px rgba(0,0,0,0.1);
-        font-size: 13px;
-    }}
-    .tooltip:hover .tooltiptext {{
-        visibility: visible;
-        opacity: 1;
-    }}
-    </style>
 
-    <div class="tooltip">
-        <span style="background-color: #e0f7fa; color: #006064; padding: 6px 12px;
-                     border-radius: 16px; font-size: 13px; font-weight: 500;
-                     display: inline-block; border: 1px solid #b2ebf2;">
-            {excipient}
-        </span>
-        <div class="tooltiptext">
-            <b>{excipient}</b><br>
-            <hr style='margin: 5px 0;'>
-            <small>{desc}</small>
-        </div>
-    </div>
-    """
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_tag_fragments(version):
+    """Tooltip tag HTML for every excipient, built once per knowledge-base version."""
+    perf_timer.miss("tag fragments")
+    return render.tag_fragments(excipient_list, excipient_descriptions)
 
-def get_incompat_hover_html(pair, severity, explanations_dict):
-    excipient1, excipient2 = pair
-    # Ensure the pair is sorted for dictionary lookup
-    sorted_pair = tuple(sorted([excipient1, excipient2]))
-    explanation = explanations_dict.get(sorted_pair, "No detailed explanation available for this specific incompatibility.")
 
-    color = "red" if severity == "Major" else "orange"
-    text_color = "white"
+with perf_timer.stage("tag fragments", cached=True):
+    tag_fragments = get_tag_fragments(kb.version)
 
-    return f"""
-    <style>
-    .incompat-tooltip {{
-        position: relative;
-        display: inline-block;
-        cursor: pointer;
-        margin-right: 5px; /* Adjust spacing as needed */
-    }}
-    .incompat-tooltip .incompat-tooltiptext {{
-        visibility: hidden;
-        width: 300px; /* Wider for explanations */
-        background-color: #f9f9f9;
-        color: #333;
-        text-align: left;
-        border: 1px solid #ccc;
-        border-radius: 8px;
-        padding: 10px;
-        position: absolute;
-        z-index: 1;
-        bottom: 125%; /* Position above the text */
-        left: 50%;
-        transform: translateX(-50%);
-        opacity: 0;
-        transition: opacity 0.3s;
-        box-shadow: 0px 2px 8px rgba(0,0,0,0.1);
-        font-size: 13px;
-    }}
-    .incompat-tooltip:hover .incompat-tooltiptext {{
-        visibility: visible;
-        opacity: 1;
-    }}
-    </style>
-    <div class="incompat-tooltip">
-        <span style="color: {color}; font-weight: bold;">
-            {severity} incompatibility
-        </span>
-        <div class="incompat-tooltiptext">
-            <b>{excipient1} & {excipient2}:</b><br>
-            <hr style='margin: 5px 0;'>
-            <small>{explanation}</small>
-        </div>
-    </div>
-    """
 
-def generate_pdf_report(excipients, issues, matrix_fig):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    margin = 55
-    line_height = 14
-    current_y = height - margin
-
-    # Header
-    c.setFont("Helvetica", 10)
-    c.drawString(margin, current_y, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-    current_y -= 20
-
-    # Title
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width / 2, current_y, "Excipient Incompatibility Report")
-    current_y -= 30
-
-    # Section headers
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, current_y, "Formulation Excipients:")
-    c.drawString(width / 2 + 20, current_y, "Incompatibility Findings:")
-    current_y -= 15
-
-    # Body text
-    c.setFont("Helvetica", 10)
-    excipient_lines = ", ".join(sorted(excipients)).split(", ")
-    issue_lines = [
-        f"❌ {pair[0]} & {pair[1]} – {severity}"
-        for pair, severity in issues
-    ] if issues else ["✅ No incompatibilities found."]
-
-    max_lines = max(len(excipient_lines), len(issue_lines))
-    for i in range(max_lines):
-        if i < len(excipient_lines):
-            c.drawString(margin, current_y, excipient_lines[i])
-        if i < len(issue_lines):
-            c.drawString(width / 2 + 20, current_y, issue_lines[i])
-        current_y -= line_height
-
-    current_y -= 10
-
-    # Adjacency Matrix Title
-    c.setFont("Helvetica-Bold", 12)
-    c.drawCentredString(width / 2, current_y, "Adjacency Matrix")
-    current_y -= 10
-
-    # Save matrix fig to image
-    img_buffer = BytesIO()
-    matrix_fig.savefig(img_buffer, format='png', bbox_inches='tight')
-    img_buffer.seek(0)
-
-    temp_img_path = tempfile.NamedTemporaryFile(delete=False, suffix='.png').name
-    with open(temp_img_path, 'wb') as f:
-        f.write(img_buffer.getbuffer())
-
-    # Resize & draw image
-    matrix_img_height = 320
-    c.drawImage(
-        temp_img_path,
-        margin,
-        current_y - matrix_img_height,
-        width=width - 2 * margin,
-        height=matrix_img_height,
-        preserveAspectRatio=True,
-        mask='auto'
-    )
+# --- Formulation history ---
+@st.cache_resource
+def get_history_store():
+    return history.HistoryStore(HISTORY_DB)
+
 
-    current_y -= (matrix_img_height + 10)
-
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-# --- Load data ---
-@st.cache_data
-def load_data():
-    df = pd.read_excel("data/Excipient Incompatibilty Grid.xlsx", index_col=0)
-    df.index = df.index.str.strip()
-    df.columns = df.columns.str.strip()
-    excipients = sorted(set(df.index) | set(df.columns))
-    return df, excipients
-
-df, excipient_list = load_data()
-
-# --- Incompatibility logic ---
-def get_incompatibility_sets(df):
-    major_incompat = set()
-    minor_incompat = set()
-    for row in df.index:
-        for col in df.columns:
-            val = df.loc[row, col]
-            pair = tuple(sorted([row, col]))
-            if val == 2:
-                major_incompat.add(pair)
-            elif val == 1:
-                minor_incompat.add(pair)
-    return major_incompat, minor_incompat
-
-def check_compatibility(excipients, major_incompat, minor_incompat):
-    issues = []
-    for a, b in combinations(excipients, 2):
-        pair = tuple(sorted([a.strip(), b.strip()]))
-        if pair in major_incompat:
-            issues.append((pair, "Major"))
-        elif pair in minor_incompat:
-            issues.append((pair, "Minor"))
-    return issues
+history_store = get_history_store()
+
+# History is keyed by a token kept in the URL, so it survives refreshes and can be bookmarked.
+if "history_owner" not in st.session_state:
+    st.session_state.history_owner = st.query_params.get("history") or uuid.uuid4().hex
+if st.query_params.get("history") != st.session_state.history_owner:
+    st.query_params["history"] = st.session_state.history_owner
+history_owner = st.session_state.history_owner
+
+
+def get_hover_html(excipient):
+    return tag_fragments.get(excipient) or render.tag_html(excipient)
 
 def load_formulation_from_history(formulation_id):
     """Loads a saved formulation's data into session state for display."""
-    for formulation in st.session_state.formulation_history:
-        if formulation["id"] == formulation_id:
-            st.session_state.final_excipients = formulation["excipients"].copy()
-            st.session_state.issues = check_compatibility(formulation["excipients"], major_incompat, minor_incompat)
-            st.session_state.show_results = True
-            break
+    formulation = history_store.get(history_owner, formulation_id)
+    if formulation:
+        st.session_state.final_excipients = formulation["excipients"]
+        # The stored result is reused unless a knowledge-base change since it was saved touches its excipients.
+        if kb_watcher.unchanged_since(formulation["kb_version"], formulation["excipients"]):
+            st.session_state.issues = formulation["issues"]
+        else:
+            st.session_state.issues = engine.check_compatibility_cached(formulation["excipients"], kb)
+        # Rule matches are reused under the same rule; older entries without them, or rule edits since, re-evaluate.
+        if formulation["rule_matches"] is not None and kb_watcher.rules_unchanged_since(formulation["kb_version"]):
+            st.session_state.rule_matches = formulation["rule_matches"]
+        else:
+            st.session_state.rule_matches = kb.rules.evaluate(formulation["excipients"], formulation["conditions"])
+        # The conditions widget is already drawn this run; it picks these up on the rerun.
+        st.session_state.loaded_conditions = formulation["conditions"]
+        st.session_state.show_results = True
     st.rerun() # Rerun to display the results for the loaded formulation
 
+def resolve_typed_excipients():
+    """Maps names typed into the multiselect (trade names, other casing, typos) onto grid names."""
+    resolutions = [kb.name_index.resolve(name) for name in st.session_state.existing_select]
+    st.session_state.existing_select = list(dict.fromkeys(r.excipient for r in resolutions if r.excipient))
+    st.session_state.name_resolutions = [r for r in resolutions if r.method != "exact"]
+
+def get_live_checker():
+    """This session's incremental checker, rebuilt if the knowledge base changed."""
+    checker = st.session_state.get("live_checker")
+    if checker is None or checker.kb.version != kb.version:
+        checker = engine.IncrementalChecker(kb)
+        st.session_state.live_checker = checker
+    return checker
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_conflict_graph(version):
+    """Sparse conflict graph and per-excipient profiles of the whole grid, built once per knowledge-base version."""
+    perf_timer.miss("conflict graph")
+    return conflict_graph.build_conflict_graph(kb)
+
+@st.cache_resource(max_entries=4, show_spinner="Finding conflict clusters...")
+def get_conflict_clusters(version, kind):
+    return get_conflict_graph(version).clusters(kind)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_risk_ordered_excipients(version):
+    return [excipient_list[i] for i in get_conflict_graph(version).order()]
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_conflict_bitsets(version):
+    """Per-excipient conflict bitsets over the whole grid, built once per knowledge-base version."""
+    perf_timer.miss("conflict bitsets")
+    return recommend.build_conflict_bitsets(kb, risk=get_conflict_graph(version).risk)
+
+@st.cache_resource
+def get_render_pool():
+    """Shared by all sessions, so at most render_pool.RENDER_WORKERS figure/PDF renders run at once."""
+    return render_pool.RenderPool()
+
+def render_matrix_png(excipients, kb):
+    return figures.matrix_png(list(excipients), engine.severity_submatrix(excipients, kb))
+
+def render_report(excipients, issues, rule_matches, kb, matrix_future):
+    # Runs on a render worker, outside any rerun, so it is timed on its own.
+    report_timer = perf.RerunTimer(enabled=perf_timer.enabled, log_path=PERF_LOG)
+    with report_timer.stage("pdf report"):
+        pdf = report.generate_pdf_report(excipients, issues, matrix_future.result(), kb.explanations,
+                                         rule_matches).getvalue()
+    if report_timer.enabled:
+        report_timer.finish(page="report", excipients=len(excipients))
+    return pdf
+
+def submit_matrix_render(excipients):
+    return get_render_pool().submit(("matrix", excipients, kb.version), render_matrix_png, excipients, kb)
+
+def report_key(excipients, issues, rule_matches):
+    return (
+        "report", excipients, kb.version,
+        tuple((tuple(pair), severity) for pair, severity in issues),
+        tuple((m.rule.rule_id, tuple(m.present)) for m in rule_matches),
+    )
 
-major_incompat, minor_incompat = get_incompatibility_sets(df)
+def prepare_report(excipients, issues, rule_matches):
+    """"Prepare Report" callback: queues the PDF, after the matrix PNG it embeds."""
+    matrix_future = submit_matrix_render(excipients)
+    key = report_key(excipients, issues, rule_matches)
+    future = get_render_pool().submit(key, render_report, excipients, issues, rule_matches, kb, matrix_future)
+    st.session_state.report_render = (key, future)
+
+def show_rendered(future, show, message):
+    if not future.done():
+        st.caption(message)
+    elif future.exception() is not None:
+        st.error(f"Rendering failed: {future.exception()}")
+    else:
+        show(future.result())
+
+def poll_rendered(future, show, message):
+    show_rendered(future, show, message)
+    if future.done():
+        st.rerun(scope="app")  # leave the polling fragment
+
+def show_when_rendered(future, show, message):
+    """Draws `show(result)` now if the render is done, otherwise a placeholder that fills in when it is."""
+    if future.done():
+        show_rendered(future, show, message)
+    else:
+        # Only this fragment reruns while the render is in progress.
+        st.fragment(poll_rendered, run_every=RENDER_REFRESH_SECONDS)(future, show, message)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_matrix_view_html(excipients, version):
+    perf_timer.miss("matrix view")
+    matrix = engine.severity_submatrix(excipients, kb)
+    return matrix_view.matrix_html(matrix_view.matrix_payload(list(excipients), matrix, kb.explanations))
+
+@st.cache_resource
+def get_subset_cache():
+    """Complete subset searches, shared by all sessions and keyed by (excipients, version)."""
+    return OrderedDict(), threading.Lock()
+
+def suggest_compatible_subsets(excipients, version):
+    """Ranked largest conflict-free subsets. A search cut short by its time budget is not
+    cached, so the next rerun searches again instead of serving the partial result."""
+    cache, lock = get_subset_cache()
+    key = (excipients, version)
+    with lock:
+        search = cache.get(key)
+        if search is not None:
+            cache.move_to_end(key)
+            return search
+    perf_timer.miss("subset search")
+    search = compatible_sets.largest_compatible_subsets(excipients, kb)
+    if search.complete:
+        with lock:
+            cache[key] = search
+            while len(cache) > SUBSET_CACHE_SIZE:
+                cache.popitem(last=False)
+    return search
+
+@st.cache_resource
+def get_bulk_executor():
+    """Shared by all sessions, so large uploads never occupy more than BULK_WORKERS threads."""
+    return ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk")
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def read_bulk_upload(data, name):
+    return bulk.read_upload(BytesIO(data), name)
+
+def start_bulk_job(frame, id_column):
+    if st.session_state.get("bulk_job") is not None:
+        st.session_state.bulk_job.cancel()
+    job = bulk.BulkJob(frame, kb, id_column=id_column)
+    st.session_state.bulk_job = job
+    get_bulk_executor().submit(job.run)
+
+def open_bulk_row():
+    """Opens the selected uploaded formulation in the regular results view."""
+    rows = st.session_state.bulk_table.selection.rows
+    if rows:
+        row = st.session_state.bulk_job.row(rows[0])
+        st.session_state.final_excipients = row["excipients"]
+        st.session_state.issues = row["issues"]
+        st.session_state.rule_matches = row["rule_matches"]
+        st.session_state.show_results = True
+
+def show_bulk_results():
+    job = st.session_state.bulk_job
+    done, total, finished = job.progress()
+    if job.error is not None:
+        st.error(f"Evaluation stopped at row {done + 1}: {job.error}")
+    elif not finished:
+        st.progress(done / total if total else 1.0, text=f"Evaluated {done:,} of {total:,} formulations...")
+    else:
+        st.caption(f"Evaluated {done:,} formulations in {job.seconds:.1f}s. Select a row to open its full result.")
+    st.dataframe(job.table(), hide_index=True, key="bulk_table", on_select=open_bulk_row, selection_mode="single-row")
+    if st.session_state.show_results or (finished and st.session_state.get("bulk_polling")):
+        st.session_state.bulk_polling = False
+        st.rerun(scope="app")  # leave the polling fragment: open the results page, or stop refreshing
+
+def show_conflict_analytics():
+    graph = get_conflict_graph(kb.version)
+    st.markdown(f"{len(excipient_list)} excipients, {len(graph.edges)} known incompatibilities "
+                f"({int((graph.severity == 2).sum())} Major).")
+    hubs_col, clusters_col = st.columns([1, 1])
+    with hubs_col:
+        st.markdown("#### Most Conflict-Prone Excipients")
+        st.dataframe(graph.hubs(10), hide_index=True)
+    with clusters_col:
+        st.markdown("#### Conflict Clusters")
+        cluster_kind = st.radio(
+            "Group by:",
+            ["components", "communities"],
+            format_func={"components": "Connected groups", "communities": "Dense communities"}.get,
+            horizontal=True,
+            key="cluster_kind",
+        )
+        clusters = get_conflict_clusters(kb.version, cluster_kind)
+        lines = []
+        for number, cluster in enumerate(clusters[:ANALYTICS_CLUSTERS], start=1):
+            names = ", ".join(cluster[:ANALYTICS_CLUSTER_NAMES])
+            more = f" and {len(cluster) - ANALYTICS_CLUSTER_NAMES} more" if len(cluster) > ANALYTICS_CLUSTER_NAMES else ""
+            lines.append(f"{number}. ({len(cluster)}) {names}{more}")
+        st.markdown("\n".join(lines))
+        if len(clusters) > ANALYTICS_CLUSTERS:
+            st.caption(f"Showing the {ANALYTICS_CLUSTERS} largest of {len(clusters)} clusters.")
+    st.markdown("#### All Excipients")
+    profiles = graph.profiles()
+    pages = max(1, -(-len(profiles) // ANALYTICS_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key="profiles_page")
+    start = (page - 1) * ANALYTICS_PAGE_SIZE
+    st.dataframe(profiles.iloc[start:start + ANALYTICS_PAGE_SIZE], hide_index=True, height=300)
 
 # --- Initialize session state ---
 if "show_results" not in st.session_state:
@@ -340,11 +384,37 @@ if not st.session_state.show_results:
 
     with col1:
         st.subheader("Select excipients for your formulation:")
+        excipient_order = st.radio(
+            "List excipients:",
+            ["A–Z", "Least conflict-prone first"],
+            horizontal=True,
+            key="excipient_order",
+            help="Conflict-prone = number of Major (counted twice) and Minor incompatibilities across the whole grid.",
+        )
         selected_excipients = st.multiselect(
             "Choose from existing excipients:",
-            options=excipient_list,
-            key="existing_select"
+            options=excipient_list if excipient_order == "A–Z" else get_risk_ordered_excipients(kb.version),
+            key="existing_select",
+            accept_new_options=True,
+            on_change=resolve_typed_excipients,
+            help="Names not in the list (trade names, typos, grade suffixes) are matched to the closest excipient."
         )
+        for resolution in st.session_state.get("name_resolutions", []):
+            if resolution.excipient:
+                st.caption(f"“{resolution.name}” → {resolution.excipient}")
+            else:
+                suggestions = ", ".join(resolution.candidates)
+                st.warning(f"“{resolution.name}” was not recognised" + (f". Did you mean: {suggestions}?" if suggestions else "."))
+        if "loaded_conditions" in st.session_state:
+            loaded = st.session_state.pop("loaded_conditions")
+            st.session_state.conditions = [c for c in loaded if c in kb.rules.conditions]
+        if kb.rules.conditions:
+            st.multiselect(
+                "Conditions:",
+                options=kb.rules.conditions,
+                key="conditions",
+                help="Processing or storage conditions; some multi-excipient rules only apply under them."
+            )
 
     with col2:
         st.subheader("Formulation:")
@@ -355,26 +425,60 @@ if not st.session_state.show_results:
         else:
             st.write("No excipients selected.")
 
+        # Live check: only the added or removed excipient is re-evaluated on each change.
+        with perf_timer.stage("live check"):
+            live_issues = get_live_checker().update(selected_excipients)
+            live_rule_matches = kb.rules.evaluate(selected_excipients, st.session_state.get("conditions", []))
+        if len(selected_excipients) > 1:
+            found = len(live_issues) + len(live_rule_matches)
+            if found:
+                st.error(f"❌ {found} incompatibilit{'y' if found == 1 else 'ies'} in the current selection.")
+                st.markdown(render.issue_list_markdown(live_issues, incompatibility_explanations, live_rule_matches), unsafe_allow_html=True)
+            else:
+                st.success("✅ No incompatibilities in the current selection.")
+
     st.markdown("")
     if st.button("Check for Incompatibilities"):
         selected = st.session_state["existing_select"]
         if selected:
-            # Save to history
-            st.session_state.formulation_counter += 1
-            form_id = st.session_state.formulation_counter # Assign a unique ID
-            new_formulation = {
-                "id": form_id, # Add the ID here
-                "name": f"Formulation {form_id}",
-                "excipients": selected.copy(),
-            }
-            st.session_state.formulation_history.insert(0, new_formulation)
-
             st.session_state.final_excipients = selected.copy()
-            st.session_state.issues = check_compatibility(selected, major_incompat, minor_incompat)
+            st.session_state.issues = get_live_checker().update(selected)
+            conditions = st.session_state.get("conditions", [])
+            st.session_state.rule_matches = kb.rules.evaluate(selected, conditions)
+
+            # Save to history
+            history_store.add(history_owner, selected, st.session_state.issues, kb.version,
+                              conditions=conditions, rule_matches=st.session_state.rule_matches)
+            st.session_state.history_page = 0
             st.session_state.show_results = True
             st.rerun()
 
 
+    # --- Bulk upload ---
+    st.markdown("---")
+    st.subheader("Evaluate Many Formulations")
+    st.markdown("<small style='color: gray;'>Upload a CSV or Excel file with one formulation per row: an 'excipients' column with ';'-separated names, or one excipient per cell.</small>", unsafe_allow_html=True)
+    upload = st.file_uploader("Formulation file", type=["csv", "xlsx"], key="bulk_upload", label_visibility="collapsed")
+    if upload is not None:
+        bulk_frame = read_bulk_upload(upload.getvalue(), upload.name)
+        name_options = ["(row number)"] + [c for c in bulk_frame.columns if c != bulk.LIST_COLUMN]
+        name_column = st.selectbox("Formulation name column:", options=name_options, key="bulk_name_column")
+        if st.button("Evaluate File"):
+            start_bulk_job(bulk_frame, None if name_column == name_options[0] else name_column)
+
+    if st.session_state.get("bulk_job") is not None:
+        # Only this fragment reruns while the job is in progress.
+        polling = not st.session_state.bulk_job.progress()[2]
+        st.session_state.bulk_polling = polling
+        st.fragment(show_bulk_results, run_every=BULK_REFRESH_SECONDS if polling else None)()
+
+
+    # --- Whole-grid analytics ---
+    # Built and sent only while switched on; its own widgets rerun just the fragment.
+    if st.toggle("Show conflict graph analytics", key="show_graph_analytics"):
+        st.fragment(show_conflict_analytics)()
+
+
     # --- Contact Information for Excipients not found ---
     st.markdown("---")
     st.subheader("Excipient Information & Support")
@@ -396,15 +500,29 @@ else:
 
         if not st.session_state.final_excipients:
             st.info("No excipients selected.")
-        elif not st.session_state.issues:
+        elif not st.session_state.issues and not st.session_state.get("rule_matches"):
             st.success("✅ This formulation is COMPATIBLE.")
         else:
             st.error("❌ This formulation is INCOMPATIBLE.")
             st.markdown("#### Issues Found:")
             st.markdown("<small style='color: gray;'>Hover over the incompatibility labels to read explanations for each issue.</small>", unsafe_allow_html=True)
-            for (pair, severity) in st.session_state.issues:
-                incompat_text_html = get_incompat_hover_html(pair, severity, incompatibility_explanations)
-                st.markdown(f"- **{pair[0]}** & **{pair[1]}** → {incompat_text_html}", unsafe_allow_html=True)
+            st.markdown(render.issue_list_markdown(st.session_state.issues, incompatibility_explanations), unsafe_allow_html=True)
+
+            if st.session_state.get("rule_matches"):
+                st.markdown("#### Multi-Excipient Rules Triggered:")
+                st.markdown(render.issue_list_markdown((), incompatibility_explanations, st.session_state.rule_matches), unsafe_allow_html=True)
+
+            if st.session_state.issues:
+                st.markdown("#### Suggested Compatible Subsets:")
+                st.markdown("<small style='color: gray;'>Largest subsets of this formulation with no Major or Minor pairwise incompatibilities.</small>", unsafe_allow_html=True)
+                with perf_timer.stage("subset search", cached=True):
+                    search = suggest_compatible_subsets(tuple(sorted(st.session_state.final_excipients)), kb.version)
+                for rank, subset in enumerate(search.subsets, start=1):
+                    dropped = ", ".join(f"**{e}**" for e in search.dropped(subset))
+                    st.markdown(f"{rank}. Keep {len(subset)} of {len(search.excipients)} — drop {dropped}")
+                if not search.complete:
+                    st.caption("Search stopped at its time budget; showing the best subsets found so far. "
+                               "The search runs again on the next check or rerun.")
 
     with right:
         st.subheader("Formulation Summary")
@@ -416,67 +534,55 @@ else:
         else:
             st.markdown("*No excipients selected.*")
 
+        if selected:
+            st.markdown("#### What Can I Add?")
+            with perf_timer.stage("conflict bitsets", cached=True):
+                bitsets = get_conflict_bitsets(kb.version)
+            if st.session_state.issues:
+                st.markdown("<small style='color: gray;'>Replacements for each offending excipient that are compatible with the rest of the formulation.</small>", unsafe_allow_html=True)
+                offending = recommend.offending_excipients(st.session_state.issues)
+                with perf_timer.stage("substitutes"):
+                    replacements = recommend.substitutes(bitsets, selected, offending)
+                for excipient, options in replacements.items():
+                    st.markdown(f"- **{excipient}** → {', '.join(options) if options else '*no compatible replacement*'}")
+            with perf_timer.stage("addable"):
+                addable = recommend.addable_excipients(bitsets, selected)
+            st.markdown(f"<small style='color: gray;'>{len(addable)} excipients can be added without introducing conflicts (least conflict-prone across the grid first).</small>", unsafe_allow_html=True)
+            st.dataframe(
+                pd.DataFrame({
+                    "Excipient": addable,
+                    "Known conflicts": [int(bitsets.degree[kb.excipient_ids[e]]) for e in addable],
+                }),
+                hide_index=True,
+                height=240,
+            )
+
     st.markdown("---")  
 
     
     matrix_col, _ = st.columns([1.5, 0.8])
 
+    formulation_key = tuple(sorted(e.strip() for e in st.session_state.final_excipients))
     with matrix_col:
         st.markdown("#### Adjacency Matrix")
-        import seaborn as sns
-        import numpy as np
-
-        def plot_compatibility_matrix(excipients):
-            excipients = [e.strip() for e in excipients]
-            size = len(excipients)
-            matrix = np.zeros((size, size))
-
-            for i in range(size):
-                for j in range(i + 1, size):
-                    pair = tuple(sorted([excipients[i], excipients[j]]))
-                    if pair in major_incompat:
-                        matrix[i, j] = 2
-                        matrix[j, i] = 2  # Mirror for symmetry
-                    elif pair in minor_incompat:
-                        matrix[i, j] = 1
-                        matrix[j, i] = 1  # Mirror for symmetry
-                    else:
-                        matrix[i, j] = 0
-                        matrix[j, i] = 0  # Explicitly set compatible
-
-            mask = np.tril(np.ones_like(matrix, dtype=bool))
-
-            cmap = sns.color_palette(["#88e388", "#FFD700", "#FF4C4C"])  # Green, Yellow, Red
-
-            plt.figure(figsize=(7.5, 7))
-            sns.heatmap(matrix,
-                        mask=mask,
-                        cmap=cmap,
-                        square=True,
-                        linewidths=0.5,
-                        linecolor='gray',
-                        xticklabels=excipients,
-                        yticklabels=excipients,
-                        cbar=False,
-                        annot=False,
-                        vmin=0, vmax=2)  # Ensure color mapping is consistent
-
-            # Gray out lower triangle
-            ax = plt.gca()
-            for y in range(size):
-                for x in range(size):
-                    if mask[y, x]:
-                        ax.add_patch(plt.Rectangle((x, y), 1, 1, fill=True, color='#D3D3D3', ec='gray'))
-
-            plt.xticks(rotation=45, ha='right', fontsize=9, fontweight='bold')
-            plt.yticks(rotation=0, fontsize=9, fontweight='bold')
-            plt.tight_layout()
-            st.pyplot(plt)
-
-        plot_compatibility_matrix(st.session_state.final_excipients)
+        if formulation_key:
+            interactive = st.toggle(
+                "Interactive view",
+                value=len(formulation_key) > INTERACTIVE_MATRIX_THRESHOLD,
+                help="Zoomable matrix drawn in the browser, with hover explanations and ordering by conflict count.",
+            )
+            if interactive:
+                with perf_timer.stage("matrix view", cached=True):
+                    matrix_html = get_matrix_view_html(formulation_key, kb.version)
+                html(matrix_html, height=640)
+            else:
+                # Rendered on the shared pool only when shown; the placeholder fills in when done.
+                with perf_timer.stage("matrix figure", cached=True):
+                    matrix_future = submit_matrix_render(formulation_key)
+                    if not matrix_future.done():
+                        perf_timer.miss("matrix figure")
+                show_when_rendered(matrix_future, partial(st.image, width="stretch"), "Drawing the adjacency matrix...")
 
-    
-    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
     st.markdown("---")
     col_a, col_b = st.columns([1, 1.75])
     with col_a:
@@ -485,51 +591,20 @@ else:
             st.rerun()
 
     with col_b:
-        if st.session_state.final_excipients:
-            # Re-generate adjacency matrix for PDF
-            fig, ax = plt.subplots(figsize=(7.5, 7))
-            size = len(st.session_state.final_excipients)
-            matrix = np.zeros((size, size))
-            for i in range(size):
-                for j in range(i + 1, size):
-                    pair = tuple(sorted([st.session_state.final_excipients[i], st.session_state.final_excipients[j]]))
-                    if pair in major_incompat:
-                        matrix[i, j] = 2
-                        matrix[j, i] = 2
-                    elif pair in minor_incompat:
-                        matrix[i, j] = 1
-                        matrix[j, i] = 1
-
-            mask = np.tril(np.ones_like(matrix, dtype=bool))
-            cmap = sns.color_palette(["#88e388", "#FFD700", "#FF4C4C"])
-            sns.heatmap(matrix,
-                        mask=mask,
-                        cmap=cmap,
-                        square=True,
-                        linewidths=0.5,
-                        linecolor='gray',
-                        xticklabels=st.session_state.final_excipients,
-                        yticklabels=st.session_state.final_excipients,
-                        cbar=False,
-                        annot=False,
-                        vmin=0, vmax=2,
-                        ax=ax)
-            plt.xticks(rotation=45, ha='right', fontsize=9, fontweight='bold')
-            plt.yticks(rotation=0, fontsize=9, fontweight='bold')
-            plt.tight_layout()
-
-            pdf = generate_pdf_report(
-                st.session_state.final_excipients,
-                st.session_state.issues,
-                fig
-            )
-
-            st.download_button(
-                label="Download Report",
-                data=pdf,
-                file_name="Excipient_Compatibility_Report.pdf",
-                mime="application/pdf"
-            )
+        if formulation_key:
+            # The PDF is rendered only once asked for, then offered for download when ready.
+            rule_matches = st.session_state.get("rule_matches", ())
+            requested = st.session_state.get("report_render")
+            if requested and requested[0] == report_key(formulation_key, st.session_state.issues, rule_matches):
+                show_when_rendered(
+                    requested[1],
+                    partial(st.download_button, "Download Report", file_name="Excipient_Compatibility_Report.pdf",
+                            mime="application/pdf"),
+                    "Preparing the PDF report...",
+                )
+            else:
+                st.button("Prepare Report", on_click=prepare_report,
+                          args=(formulation_key, st.session_state.issues, rule_matches))
 
     # --- Disclaimer ---
     st.markdown(
@@ -544,62 +619,113 @@ else:
 
 
 
-def rename_formulation(idx):
-    key = f"rename_input_{idx}"
-    new_name = st.session_state.get(key, "").strip()
-    old_name_key = f"old_name_{idx}"
+def rename_formulation(formulation_id):
+    new_name = st.session_state.get(f"rename_input_{formulation_id}", "").strip()
+    if new_name:
+        history_store.rename(history_owner, formulation_id, new_name)
+    st.session_state.renaming_id = None  # exit editing mode
+
+def start_renaming(formulation_id):
+    st.session_state.renaming_id = formulation_id
 
-    # Only update if name changed and is not empty
-    if new_name and new_name != st.session_state.get(old_name_key, ""):
-        st.session_state.formulation_history[idx]["name"] = new_name
-        st.session_state[old_name_key] = new_name
+def delete_formulation(formulation_id):
+    history_store.delete(history_owner, formulation_id)
+    if st.session_state.renaming_id == formulation_id:
+        st.session_state.renaming_id = None
 
-    st.session_state.renaming_index = None  # exit editing mode
+def reset_history_page():
+    st.session_state.history_page = 0
 
 with st.sidebar:
     st.markdown("## Formulation History")
-    st.markdown("")
+    search = st.text_input(
+        "Search history",
+        key="history_search",
+        placeholder="Search by name or excipient",
+        label_visibility="collapsed",
+        on_change=reset_history_page,
+    )
 
-    if not st.session_state.formulation_history:
-        st.markdown("No saved formulations.")
-    else:
-        if "renaming_index" not in st.session_state:
-            st.session_state.renaming_index = None
+    with perf_timer.stage("history"):
+        entries, total = history_store.page(history_owner, st.session_state.history_page, HISTORY_PAGE_SIZE, search)
+        if not entries and st.session_state.history_page > 0:
+            # The last entry on this page was deleted
+            st.session_state.history_page = 0
+            entries, total = history_store.page(history_owner, 0, HISTORY_PAGE_SIZE, search)
 
-        for idx, f in enumerate(st.session_state.formulation_history):
+    if not total:
+        st.markdown("No matching formulations." if search else "No saved formulations.")
+    else:
+        for f in entries:
             col1, col2, col3 = st.columns([5, 1, 1])
 
             with col1:
-                if st.session_state.renaming_index == idx:
-                    old_name_key = f"old_name_{idx}"
-                    if old_name_key not in st.session_state:
-                        st.session_state[old_name_key] = f["name"]
-
-                    new_name = st.text_input(
-                        "",
+                if st.session_state.renaming_id == f["id"]:
+                    st.text_input(
+                        "Rename formulation",
                         value=f["name"],
-                        key=f"rename_input_{idx}",
+                        key=f"rename_input_{f['id']}",
                         label_visibility="collapsed",
                         placeholder="Rename formulation and press Enter",
                         on_change=rename_formulation,
-                        args=(idx,),
+                        args=(f["id"],),
                     )
                 else:
                     # Make the formulation name a clickable button
-                    if st.button(f.get('name', f"Formulation {f['id']}"), key=f"load_formulation_{idx}"):
-                        load_formulation_from_history(f["id"]) # Call the new function
+                    if st.button(f["name"], key=f"load_formulation_{f['id']}"):
+                        load_formulation_from_history(f["id"])
 
             with col2:
-                if st.button("✎", key=f"edit_{idx}"):
-                    st.session_state.renaming_index = idx
+                st.button("✎", key=f"edit_{f['id']}", on_click=start_renaming, args=(f["id"],))
 
             with col3:
-                if st.button("✖", key=f"delete_{idx}"):
-                    st.session_state.formulation_history.pop(idx)
-                    if st.session_state.renaming_index == idx:
-                        st.session_state.renaming_index = None
-                    # Break to avoid index errors after deletion
-                    break
+                st.button("✖", key=f"delete_{f['id']}", on_click=delete_formulation, args=(f["id"],))
+
+        pages = -(-total // HISTORY_PAGE_SIZE)
+        if pages > 1:
+            prev_col, label_col, next_col = st.columns([1, 3, 1])
+            with prev_col:
+                if st.button("‹", key="history_prev", disabled=st.session_state.history_page == 0):
+                    st.session_state.history_page -= 1
+                    st.rerun()
+            with label_col:
+                st.caption(f"Page {st.session_state.history_page + 1} of {pages} · {total} formulations")
+            with next_col:
+                if st.button("›", key="history_next", disabled=st.session_state.history_page >= pages - 1):
+                    st.session_state.history_page += 1
+                    st.rerun()
+
+    st.markdown("---")
+    st.caption(f"Knowledge base {kb.version[:8]} · loaded from {kb.source} in {kb.load_seconds:.2f}s")
+    if kb_watcher.reloads:
+        last_reload = kb_watcher.reloads[-1]
+        st.caption(
+            f"Reloaded {time.strftime('%H:%M', time.localtime(last_reload.at))}: {last_reload.diff.summary()}"
+            f" · cached results kept {last_reload.cache_kept}, dropped {last_reload.cache_dropped}"
+        )
+    if kb_watcher.error:
+        st.warning(kb_watcher.error)
+    cache_stats = engine.RESULT_CACHE.stats()
+    st.caption(f"Result cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['entries']} entries)")
+
+    if perf_timer.enabled:
+        perf_record = perf_timer.finish(
+            page="results" if st.session_state.show_results else "input",
+            excipients=len(st.session_state.get("final_excipients" if st.session_state.show_results else "existing_select") or []),
+            result_cache=cache_stats,
+        )
+        perf_history = st.session_state.setdefault("perf_history", deque(maxlen=PERF_HISTORY_SIZE))
+        perf_history.append(perf_record)
+
+    if show_perf_panel:
+        with st.expander("Performance", expanded=True):
+            st.caption(f"Last rerun: {perf_record['total_ms']:.1f} ms on the {perf_record['page']} page")
+            stages = pd.DataFrame(perf_record["stages"], columns=["stage", "ms", "cache_hit"])
+            st.dataframe(stages.round({"ms": 2}), hide_index=True)
+            rates = perf.hit_rates(perf_history)
+            if rates:
+                st.caption(f"Cache hits over the last {len(perf_history)} reruns:")
+                st.markdown("\n".join(f"- {stage}: {hits}/{calls}" for stage, (hits, calls) in rates.items()))
 
 
 
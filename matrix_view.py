@@ -0,0 +1,190 @@
+"""Interactive, client-side rendered adjacency matrix for large formulations.
+
+The server only serializes the labels, the upper-triangle conflicts as sparse
+(row, col, severity) triples and the rationales of those pairs; the browser draws the
+matrix on a canvas. Server cost therefore grows with the number of conflicts, not with
+rasterizing N x N cells. The view supports wheel zoom, drag to pan, hover explanations
+and reordering rows/columns by conflict count.
+"""
+import json
+
+import numpy as np
+
+import engine
+
+
+def matrix_payload(excipients, matrix, explanations):
+    rows, cols = np.nonzero(np.triu(matrix, k=1))
+    cells = []
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        pair = tuple(sorted([excipients[i], excipients[j]]))
+        cells.append([i, j, int(matrix[i, j]), explanations.get(pair, engine.NO_EXPLANATION)])
+    return {"labels": list(excipients), "cells": cells}
+
+
+def matrix_html(payload, height=640):
+    # "</" would end the <script> element early if it appeared inside a label or rationale.
+    data = json.dumps(payload).replace("</", "<\\/")
+    return _TEMPLATE.replace("__DATA__", data).replace("__HEIGHT__", str(height - 50))
+
+
+_TEMPLATE = """
+<div id="mv-root" style="font-family: sans-serif; font-size: 13px;">
+  <div style="margin-bottom: 6px;">
+    <button id="mv-order">Order by conflict count</button>
+    <button id="mv-reset">Reset view</button>
+    <span style="color: gray; margin-left: 8px;">Scroll to zoom, drag to pan, hover a cell for details.</span>
+  </div>
+  <div style="position: relative;">
+    <canvas id="mv-canvas" style="width: 100%; height: __HEIGHT__px; border: 1px solid #ddd; cursor: grab;"></canvas>
+    <div id="mv-tip" style="display: none; position: absolute; max-width: 320px; background: #f9f9f9; color: #333;
+         border: 1px solid #ccc; border-radius: 8px; padding: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+         pointer-events: none; font-size: 12px;"></div>
+  </div>
+</div>
+<script>
+(function () {
+  const data = __DATA__;
+  const n = data.labels.length;
+  const COLOURS = ["#88e388", "#FFD700", "#FF4C4C"];
+  const LOWER = "#D3D3D3";
+  const LABEL_SPACE = 160;
+
+  const severity = new Uint8Array(n * n);
+  const rationale = new Map();
+  const degree = new Array(n).fill(0);
+  for (const [i, j, s, text] of data.cells) {
+    severity[i * n + j] = s;
+    severity[j * n + i] = s;
+    rationale.set(Math.min(i, j) * n + Math.max(i, j), text);
+    degree[i] += 1;
+    degree[j] += 1;
+  }
+
+  const canvas = document.getElementById("mv-canvas");
+  const tip = document.getElementById("mv-tip");
+  const ctx = canvas.getContext("2d");
+  let order = [...Array(n).keys()];
+  let byConflicts = false;
+  let zoom = 1, panX = 0, panY = 0;
+
+  function baseCell() {
+    return Math.max(2, Math.min((canvas.clientWidth - LABEL_SPACE) / n, (canvas.clientHeight - LABEL_SPACE) / n));
+  }
+
+  function draw() {
+    const ratio = window.devicePixelRatio || 1;
+    canvas.width = canvas.clientWidth * ratio;
+    canvas.height = canvas.clientHeight * ratio;
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, canvas.clientWidth, canvas.clientHeight);
+
+    const cell = baseCell() * zoom;
+    const x0 = LABEL_SPACE + panX, y0 = LABEL_SPACE + panY;
+    // Only visit the cells inside the viewport.
+    const first = (o) => Math.max(0, Math.floor(-o / cell));
+    const last = (o, size) => Math.min(n - 1, Math.floor((size - o) / cell));
+    const c0 = first(x0 - LABEL_SPACE), c1 = last(x0, canvas.clientWidth);
+    const r0 = first(y0 - LABEL_SPACE), r1 = last(y0, canvas.clientHeight);
+
+    for (let r = r0; r <= r1; r++) {
+      for (let c = c0; c <= c1; c++) {
+        ctx.fillStyle = c <= r ? LOWER : COLOURS[severity[order[r] * n + order[c]]];
+        ctx.fillRect(x0 + c * cell, y0 + r * cell, cell, cell);
+      }
+    }
+    if (cell >= 6) {
+      ctx.strokeStyle = "gray";
+      ctx.lineWidth = 0.5;
+      for (let r = r0; r <= r1; r++) {
+        for (let c = c0; c <= c1; c++) ctx.strokeRect(x0 + c * cell, y0 + r * cell, cell, cell);
+      }
+    }
+
+    ctx.clearRect(0, 0, canvas.clientWidth, LABEL_SPACE);
+    ctx.clearRect(0, 0, LABEL_SPACE, canvas.clientHeight);
+    if (cell >= 7) {
+      ctx.fillStyle = "black";
+      ctx.font = "bold " + Math.min(12, cell * 0.8) + "px sans-serif";
+      ctx.textAlign = "right";
+      ctx.textBaseline = "middle";
+      for (let r = r0; r <= r1; r++) {
+        const y = y0 + (r + 0.5) * cell;
+        if (y > LABEL_SPACE) ctx.fillText(data.labels[order[r]], LABEL_SPACE - 4, y, LABEL_SPACE - 8);
+      }
+      for (let c = c0; c <= c1; c++) {
+        const x = x0 + (c + 0.5) * cell;
+        if (x < LABEL_SPACE) continue;
+        ctx.save();
+        ctx.translate(x, LABEL_SPACE - 4);
+        ctx.rotate(-Math.PI / 4);
+        ctx.textAlign = "left";
+        ctx.fillText(data.labels[order[c]], 0, 0, LABEL_SPACE * 1.3);
+        ctx.restore();
+      }
+    }
+  }
+
+  function cellAt(event) {
+    const rect = canvas.getBoundingClientRect();
+    const cell = baseCell() * zoom;
+    const c = Math.floor((event.clientX - rect.left - LABEL_SPACE - panX) / cell);
+    const r = Math.floor((event.clientY - rect.top - LABEL_SPACE - panY) / cell);
+    return r >= 0 && c >= 0 && r < n && c < n ? [r, c] : null;
+  }
+
+  canvas.addEventListener("wheel", (event) => {
+    event.preventDefault();
+    const rect = canvas.getBoundingClientRect();
+    const mx = event.clientX - rect.left - LABEL_SPACE, my = event.clientY - rect.top - LABEL_SPACE;
+    const factor = event.deltaY < 0 ? 1.2 : 1 / 1.2;
+    const next = Math.min(40, Math.max(1, zoom * factor));
+    panX = mx - (mx - panX) * (next / zoom);
+    panY = my - (my - panY) * (next / zoom);
+    zoom = next;
+    draw();
+  }, { passive: false });
+
+  let drag = null;
+  canvas.addEventListener("mousedown", (event) => { drag = [event.clientX - panX, event.clientY - panY]; canvas.style.cursor = "grabbing"; });
+  window.addEventListener("mouseup", () => { drag = null; canvas.style.cursor = "grab"; });
+  canvas.addEventListener("mouseleave", () => { tip.style.display = "none"; });
+  canvas.addEventListener("mousemove", (event) => {
+    if (drag) {
+      panX = event.clientX - drag[0];
+      panY = event.clientY - drag[1];
+      tip.style.display = "none";
+      draw();
+      return;
+    }
+    const hit = cellAt(event);
+    if (!hit || hit[1] <= hit[0]) { tip.style.display = "none"; return; }
+    const a = order[hit[0]], b = order[hit[1]];
+    const s = severity[a * n + b];
+    tip.innerHTML = "<b class='mv-a'></b> &amp; <b class='mv-b'></b><br><b class='mv-s'></b>"
+      + (s ? "<hr style='margin: 5px 0;'><small class='mv-r'></small>" : "");
+    tip.querySelector(".mv-a").textContent = data.labels[a];
+    tip.querySelector(".mv-b").textContent = data.labels[b];
+    const label = tip.querySelector(".mv-s");
+    label.textContent = s === 2 ? "Major incompatibility" : s === 1 ? "Minor incompatibility" : "Compatible";
+    label.style.color = s === 2 ? "red" : s === 1 ? "orange" : "green";
+    if (s) tip.querySelector(".mv-r").textContent = rationale.get(Math.min(a, b) * n + Math.max(a, b));
+    const rect = canvas.getBoundingClientRect();
+    tip.style.left = Math.min(event.clientX - rect.left + 12, canvas.clientWidth - 330) + "px";
+    tip.style.top = (event.clientY - rect.top + 12) + "px";
+    tip.style.display = "block";
+  });
+
+  document.getElementById("mv-order").addEventListener("click", (event) => {
+    byConflicts = !byConflicts;
+    order = [...Array(n).keys()];
+    if (byConflicts) order.sort((a, b) => degree[b] - degree[a] || a - b);
+    event.target.textContent = byConflicts ? "Original order" : "Order by conflict count";
+    draw();
+  });
+  document.getElementById("mv-reset").addEventListener("click", () => { zoom = 1; panX = 0; panY = 0; draw(); });
+  window.addEventListener("resize", draw);
+  draw();
+})();
+</script>
+"""
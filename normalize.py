@@ -0,0 +1,162 @@
+"""Resolution of free-text excipient names (trade names, casing, grade suffixes, typos) to grid names.
+
+A name is tried, in order, against:
+
+1. the grid names themselves,
+2. the normalized form of grid names and synonyms (casefolded, punctuation and pharmacopoeial
+   grade suffixes such as "NF" or "Ph. Eur." removed, common abbreviations such as "Mg"
+   expanded), so "Magnesium Stearate NF" and "mg stearate" both hit directly; a name is also
+   indexed without, and by, its parenthesised abbreviation ("Magnesium Stearate", "MgSt"),
+3. a trigram index over those normalized forms, scored by Dice similarity, for typos.
+
+Synonyms come from the optional workbook "data/Excipient Synonyms.xlsx" with columns
+"Synonym" and "Excipient".
+
+    index = NameIndex(kb.excipient_list, kb.synonyms)
+    index.resolve("Mg stearate NF").excipient   # "Magnesium Stearate (MgSt)"
+"""
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+GRADE_SUFFIXES = {"nf", "usp", "ep", "bp", "jp", "pheur", "eur", "ph", "fcc", "ip", "grade"}
+ABBREVIATIONS = {
+    "mg": "magnesium",
+    "na": "sodium",
+    "k": "potassium",
+    "ca": "calcium",
+    "zn": "zinc",
+    "fe": "iron",
+    "al": "aluminum",
+    "aluminium": "aluminum",
+    "hcl": "hydrochloride",
+    "peg": "polyethylene glycol",
+    "pvp": "povidone",
+    "mcc": "microcrystalline cellulose",
+}
+MIN_SCORE = 0.6  # Dice similarity below which a fuzzy candidate is reported as unresolved
+AMBIGUITY_MARGIN = 0.05  # a runner-up this close to the best match makes the name ambiguous
+CANDIDATES = 3
+SUGGESTION_SCORE = 0.3  # below this, unresolved names come back without suggestions
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+_PARENTHESES = re.compile(r"\(([^)]*)\)")
+
+
+def normalize(name):
+    """Casefolded, punctuation-free form of `name` with grade suffixes dropped and abbreviations expanded."""
+    tokens = _NON_WORD.sub(" ", str(name).casefold()).split()
+    return " ".join(ABBREVIATIONS.get(t, t) for t in tokens if t not in GRADE_SUFFIXES)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class Resolution:
+    name: str  # as given
+    excipient: str  # grid name, or None if unresolved
+    method: str  # "exact", "normalized", "synonym", "fuzzy" or "unresolved"
+    score: float = 1.0
+    candidates: tuple = ()  # closest grid names, for unresolved names
+
+
+class NameIndex:
+    def __init__(self, excipient_list, synonyms=None, min_score=MIN_SCORE):
+        self.excipient_list = list(excipient_list)
+        self.min_score = min_score
+        self._ids = ids = {name: i for i, name in enumerate(self.excipient_list)}
+
+        # Normalized key -> (excipient id, method). Later layers win on collisions: the name
+        # without / inside its parentheses ("Magnesium Stearate", "MgSt"), then synonyms, then
+        # full grid names. A derived key shared by two excipients ("Capsules") is dropped.
+        self._keys = {}
+        derived = {}
+        for name, i in ids.items():
+            for part in [_PARENTHESES.sub(" ", name)] + _PARENTHESES.findall(name):
+                key = normalize(part)
+                if key:
+                    derived.setdefault(key, set()).add(i)
+        for key, owners in derived.items():
+            if len(owners) == 1:
+                self._keys[key] = (owners.pop(), "normalized")
+        for synonym, excipient in (synonyms or {}).items():
+            if excipient in ids and normalize(synonym):
+                self._keys[normalize(synonym)] = (ids[excipient], "synonym")
+        for name, i in ids.items():
+            self._keys[normalize(name)] = (i, "normalized")
+
+        self._key_list = list(self._keys)
+        self._key_ids = np.array([self._keys[k][0] for k in self._key_list], dtype=np.intp)
+        self._key_grams = np.array([len(trigrams(k)) for k in self._key_list], dtype=np.intp)
+        postings = {}
+        for position, key in enumerate(self._key_list):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(positions, dtype=np.intp) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.excipient_list)
+
+    def resolve(self, name):
+        text = str(name).strip()
+        if text in self._ids:
+            return Resolution(name, text, "exact")
+        key = normalize(text)
+        if key in self._keys:
+            i, method = self._keys[key]
+            return Resolution(name, self.excipient_list[i], method)
+
+        grams = trigrams(key) if key else set()
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return Resolution(name, None, "unresolved", 0.0)
+        shared = np.bincount(np.concatenate(hits), minlength=len(self._key_ids))
+        scores = 2 * shared / (len(grams) + self._key_grams)
+        # Best score per excipient, highest first.
+        best, containing = {}, set()
+        tokens = set(key.split())
+        for position in np.argsort(-scores, kind="stable")[:CANDIDATES * 2]:
+            excipient = self.excipient_list[self._key_ids[position]]
+            best.setdefault(excipient, float(scores[position]))
+            if tokens <= set(self._key_list[position].split()):
+                containing.add(excipient)
+        ranked = list(best.items())[:CANDIDATES]
+        top, score = ranked[0]
+        # Too close to call, or a partial name ("Capsules") that several excipients contain.
+        ambiguous = any(s >= score - AMBIGUITY_MARGIN for _, s in ranked[1:]) or len(containing) > 1
+        if score >= self.min_score and not ambiguous:
+            return Resolution(name, top, "fuzzy", score)
+        suggestions = tuple(n for n, s in ranked if s >= SUGGESTION_SCORE)
+        return Resolution(name, None, "unresolved", score, suggestions)
+
+    def resolve_many(self, names):
+        """(grid names in input order without duplicates, [Resolution, ...] of the names that did not resolve)."""
+        resolved, unresolved = {}, []
+        for name in names:
+            if not str(name).strip():
+                continue
+            resolution = self.resolve(name)
+            if resolution.excipient is None:
+                unresolved.append(resolution)
+            else:
+                resolved.setdefault(resolution.excipient)
+        return list(resolved), unresolved
+
+
+def load_synonyms(path):
+    """Returns ({synonym: grid name}, messages). A missing workbook means no synonyms."""
+    try:
+        synonyms_df = pd.read_excel(path)
+    except FileNotFoundError:
+        return {}, ()
+    synonyms_df.columns = synonyms_df.columns.str.strip()
+    try:
+        pairs = zip(synonyms_df["Synonym"].astype(str).str.strip(), synonyms_df["Excipient"].astype(str).str.strip())
+    except KeyError as e:
+        return {}, (("error", f"Error reading '{path}': Missing expected column. Please ensure it has 'Synonym' and 'Excipient' columns. Detail: {e}"),)
+    return {synonym: excipient for synonym, excipient in pairs if synonym and excipient}, ()
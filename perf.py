@@ -0,0 +1,76 @@
+"""Per-rerun stage timings for the app.
+
+main.py wraps each stage of a script run in `timer.stage(name)`. Cached stages pass
+`cached=True`, and the cached function calls `timer.miss(name)` in its body, which only
+runs on a cache miss, so every timing also records whether the cache was hit. When the
+timer is disabled, `stage` returns a shared no-op context manager and `miss` returns
+immediately.
+
+    timer = RerunTimer(enabled=True, log_path="perf.jsonl")
+    with timer.stage("check"):
+        ...
+    record = timer.finish(page="results")
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+_DISABLED = nullcontext()
+_log_lock = threading.Lock()
+
+
+class RerunTimer:
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = enabled or bool(log_path)
+        self.log_path = log_path
+        self.stages = []  # {"stage", "ms", "cache_hit"} in completion order
+        self._start = time.perf_counter()
+        self._missed = set()
+
+    def stage(self, name, cached=False):
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name, cached)
+
+    @contextmanager
+    def _timed(self, name, cached):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                "stage": name,
+                "ms": (time.perf_counter() - start) * 1000,
+                "cache_hit": name not in self._missed if cached else None,
+            })
+
+    def miss(self, name):
+        if self.enabled:
+            self._missed.add(name)
+
+    def finish(self, **context):
+        """The rerun's record (total time, stages and `context`), appended to the log file if there is one."""
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "total_ms": (time.perf_counter() - self._start) * 1000,
+            **context,
+            "stages": self.stages,
+        }
+        if self.log_path:
+            line = json.dumps(record, ensure_ascii=False)
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return record
+
+
+def hit_rates(records):
+    """{stage: (cache hits, cached calls)} over a sequence of rerun records."""
+    rates = {}
+    for record in records:
+        for stage in record["stages"]:
+            if stage["cache_hit"] is not None:
+                hits, calls = rates.get(stage["stage"], (0, 0))
+                rates[stage["stage"]] = (hits + stage["cache_hit"], calls + 1)
+    return rates
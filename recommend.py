@@ -0,0 +1,86 @@
+""""What can I add?" recommendations from precomputed per-excipient conflict bitsets.
+
+Each excipient's conflicts over the whole grid are packed into one bit row, built once
+per knowledge base. Checking a candidate against a selection is then a single AND of
+its row with the selection's bits, vectorized over all candidates at once. Suggestions are
+ranked least risky first, by the grid-wide risk score from conflict_graph when given.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+ROW_BLOCK = 1024  # severity-matrix rows turned into bits per step
+
+
+@dataclass(frozen=True)
+class ConflictBitsets:
+    bits: np.ndarray  # (N, ceil(N / 8)) uint8; bit j of row i set if i conflicts with j
+    degree: np.ndarray  # number of conflicts per excipient
+    risk: np.ndarray  # ranking score per excipient, lower first
+    excipient_list: list
+    excipient_ids: dict
+
+    def selection(self, excipients, exclude=()):
+        """Packed bits of the known excipients in `excipients`, minus `exclude`."""
+        mask = np.zeros(len(self.excipient_list), dtype=bool)
+        skip = {e.strip() for e in exclude}
+        ids = [self.excipient_ids[n] for n in (e.strip() for e in excipients) if n in self.excipient_ids and n not in skip]
+        mask[ids] = True
+        return np.packbits(mask), mask
+
+    def compatible_with(self, excipients, exclude=()):
+        """Boolean mask of excipients that conflict with nothing in the selection (minus `exclude`)."""
+        selection_bits, _ = self.selection(excipients, exclude)
+        return ~np.bitwise_and(self.bits, selection_bits).any(axis=1)
+
+
+def build_conflict_bitsets(kb, min_severity=1, risk=None):
+    """`risk` (e.g. ConflictGraph.risk) ranks suggestions; by default the conflict count does."""
+    size = len(kb.excipient_list)
+    bits = np.empty((size, (size + 7) // 8), dtype=np.uint8)
+    degree = np.empty(size, dtype=np.intp)
+    for start in range(0, size, ROW_BLOCK):  # row blocks: no N x N boolean temporary
+        conflicts = np.asarray(kb.severity_matrix[start:start + ROW_BLOCK]) >= min_severity
+        conflicts[np.arange(len(conflicts)), np.arange(start, start + len(conflicts))] = False
+        bits[start:start + len(conflicts)] = np.packbits(conflicts, axis=1)
+        degree[start:start + len(conflicts)] = conflicts.sum(axis=1)
+    return ConflictBitsets(
+        bits=bits,
+        degree=degree,
+        risk=degree if risk is None else np.asarray(risk),
+        excipient_list=kb.excipient_list,
+        excipient_ids=kb.excipient_ids,
+    )
+
+
+def _ranked(bitsets, mask):
+    # Least risky across the grid first, then fewest conflicts.
+    candidates = np.flatnonzero(mask)
+    order = np.lexsort((candidates, bitsets.degree[candidates], bitsets.risk[candidates]))
+    return [bitsets.excipient_list[i] for i in candidates[order]]
+
+
+def addable_excipients(bitsets, excipients):
+    """Every excipient not in the selection that can be added without introducing a conflict."""
+    mask = bitsets.compatible_with(excipients)
+    _, selected = bitsets.selection(excipients)
+    return _ranked(bitsets, mask & ~selected)
+
+
+def substitutes(bitsets, excipients, offending, limit=5):
+    """{offending excipient: best replacements}, each compatible with the rest of the selection."""
+    _, selected = bitsets.selection(excipients)
+    suggestions = {}
+    for excipient in offending:
+        mask = bitsets.compatible_with(excipients, exclude=[excipient]) & ~selected
+        suggestions[excipient] = _ranked(bitsets, mask)[:limit]
+    return suggestions
+
+
+def offending_excipients(issues):
+    """Excipients involved in at least one issue, most issues first."""
+    counts = {}
+    for pair, _ in issues:
+        for excipient in pair:
+            counts[excipient] = counts.get(excipient, 0) + 1
+    return sorted(counts, key=lambda e: (-counts[e], e))
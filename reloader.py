@@ -0,0 +1,139 @@
+"""Hot reload of the knowledge base while the app (or API) keeps serving.
+
+A KnowledgeBaseWatcher owns the current KnowledgeBase. A daemon thread polls the source
+workbooks' (mtime, size) signature. Once a change has been stable for one poll (so a
+half-saved workbook is not read), it rebuilds the knowledge base in the background,
+diffs it against the current one, lets the result cache keep whatever the diff leaves
+valid, and only then replaces `current`. Readers take `watcher.current` once per
+request or rerun and keep using that object, so work in flight finishes on the version
+it started with. A workbook that fails to load is reported and the old version stays.
+
+    watcher = KnowledgeBaseWatcher(on_reload=[engine.RESULT_CACHE.apply_diff])
+    watcher.start()
+    kb = watcher.current
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import knowledge_base
+
+POLL_SECONDS = 2.0
+RELOAD_LOG_SIZE = 20
+
+
+@dataclass(frozen=True)
+class Reload:
+    at: float  # time.time()
+    diff: knowledge_base.KnowledgeBaseDiff
+    seconds: float  # rebuild time
+    cache_kept: int = 0
+    cache_dropped: int = 0
+
+
+class KnowledgeBaseWatcher:
+    def __init__(self, poll_seconds=POLL_SECONDS, on_reload=()):
+        self.poll_seconds = poll_seconds
+        self.on_reload = list(on_reload)  # callables (diff, old_kb, new_kb) -> optional (kept, dropped)
+        self.reloads = deque(maxlen=RELOAD_LOG_SIZE)
+        self.error = None  # message of the last failed reload, cleared by the next success
+        self._signature = knowledge_base.source_signature()
+        self.current = knowledge_base.load()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def _diffs_since(self, version):
+        """Diffs of the reloads from `version` to the current one; None if `version` predates the reload log."""
+        if version == self.current.version:
+            return []
+        chain = list(self.reloads)
+        for i, record in enumerate(chain):
+            if record.diff.old_version == version:
+                return [r.diff for r in chain[i:]] if chain[-1].diff.new_version == self.current.version else None
+        return None
+
+    def unchanged_since(self, version, excipients):
+        """True if every reload since `version` left all of `excipients` untouched, so a result
+        computed against `version` is still valid. False when `version` predates the reload log."""
+        diffs = self._diffs_since(version)
+        names = set(excipients)
+        return diffs is not None and all(not names & diff.touched_excipients for diff in diffs)
+
+    def rules_unchanged_since(self, version):
+        """True if no reload since `version` edited the rules, so rule matches computed then still hold."""
+        diffs = self._diffs_since(version)
+        return diffs is not None and not any(diff.rules_changed for diff in diffs)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="knowledge-base-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.poll_seconds):
+            signature = knowledge_base.source_signature()
+            if signature == self._signature:
+                pending = None
+            elif signature != pending:
+                pending = signature  # changed since the last poll: wait until the files settle
+            else:
+                try:
+                    self.reload(signature)
+                except Exception as e:  # never let one bad reload end the watcher thread
+                    self.error = f"Reload failed: {e}"
+                    self._signature = signature
+                pending = None
+
+    def reload(self, signature=None):
+        """Rebuilds from the workbooks and swaps the result in. Returns the Reload, or None if nothing changed."""
+        with self._reload_lock:
+            signature = signature or knowledge_base.source_signature()
+            old = self.current
+            start = time.perf_counter()
+            try:
+                version = knowledge_base.content_hash()
+                if version == old.version:
+                    self._signature = signature
+                    return None
+                new = knowledge_base.load(version)
+                if any(level == "error" for level, _ in new.messages):
+                    raise ValueError("; ".join(message for _, message in new.messages))
+            except Exception as e:  # keep serving the old version until the workbooks load again
+                self.error = f"Reload failed, still serving {old.version[:8]}: {e}"
+                self._signature = signature
+                return None
+
+            try:
+                diff = knowledge_base.diff(old, new)
+            except Exception as e:
+                self.error = f"Reload failed, still serving {old.version[:8]}: could not diff versions: {e}"
+                self._signature = signature
+                return None
+            kept = dropped = 0
+            failed = []
+            for callback in self.on_reload:
+                # A failing callback is reported; the new version is still valid and goes into service.
+                try:
+                    counts = callback(diff, old, new)
+                except Exception as e:
+                    failed.append(f"{getattr(callback, '__qualname__', callback)}: {e}")
+                    continue
+                if counts:
+                    kept, dropped = kept + counts[0], dropped + counts[1]
+            self.current = new
+            self._signature = signature
+            self.error = f"Reloaded {new.version[:8]}, but on-reload callbacks failed: {'; '.join(failed)}" if failed else None
+            record = Reload(time.time(), diff, time.perf_counter() - start, kept, dropped)
+            self.reloads.append(record)
+            return record
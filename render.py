@@ -0,0 +1,102 @@
+"""HTML fragments for the excipient tags and incompatibility labels.
+
+The tooltip stylesheet is emitted once per page (TOOLTIP_CSS) rather than with every
+fragment, and fragments are single-line so a whole list of issues can go out in one
+st.markdown call as a Markdown list.
+"""
+import engine
+
+TOOLTIP_CSS = """
+<style>
+.tooltip, .incompat-tooltip {
+    position: relative;
+    display: inline-block;
+    cursor: pointer;
+}
+.tooltip { margin: 4px; }
+.incompat-tooltip { margin-right: 5px; }
+.tooltip .tooltiptext, .incompat-tooltip .incompat-tooltiptext {
+    visibility: hidden;
+    background-color: #f9f9f9;
+    color: #333;
+    text-align: left;
+    border: 1px solid #ccc;
+    border-radius: 8px;
+    padding: 10px;
+    position: absolute;
+    z-index: 1;
+    bottom: 125%; /* Position above the text */
+    left: 50%;
+    transform: translateX(-50%);
+    opacity: 0;
+    transition: opacity 0.3s;
+    box-shadow: 0px 2px 8px rgba(0,0,0,0.1);
+    font-size: 13px;
+}
+.tooltip .tooltiptext { width: 250px; }
+.incompat-tooltip .incompat-tooltiptext { width: 300px; /* Wider for explanations */ }
+.tooltip:hover .tooltiptext, .incompat-tooltip:hover .incompat-tooltiptext {
+    visibility: visible;
+    opacity: 1;
+}
+.excipient-tag {
+    background-color: #e0f7fa;
+    color: #006064;
+    padding: 6px 12px;
+    border-radius: 16px;
+    font-size: 13px;
+    font-weight: 500;
+    display: inline-block;
+    border: 1px solid #b2ebf2;
+}
+</style>
+"""
+
+NO_DESCRIPTION = "No description available."
+NO_RULE_EXPLANATION = "No detailed explanation available for this rule."
+SEVERITY_COLOURS = {"Major": "red", "Minor": "orange"}
+
+
+def tag_html(excipient, description=None):
+    return (
+        f'<div class="tooltip"><span class="excipient-tag">{excipient}</span>'
+        f'<div class="tooltiptext"><b>{excipient}</b><br><hr style="margin: 5px 0;">'
+        f'<small>{description or NO_DESCRIPTION}</small></div></div>'
+    )
+
+
+def tag_fragments(excipient_list, descriptions):
+    """{excipient: tag HTML} for the whole knowledge base."""
+    return {name: tag_html(name, descriptions.get(name)) for name in excipient_list}
+
+
+def severity_tooltip_html(severity, title, explanation):
+    colour = SEVERITY_COLOURS.get(severity, "orange")
+    return (
+        f'<div class="incompat-tooltip"><span style="color: {colour}; font-weight: bold;">{severity} incompatibility</span>'
+        f'<div class="incompat-tooltiptext"><b>{title}:</b><br><hr style="margin: 5px 0;">'
+        f'<small>{explanation}</small></div></div>'
+    )
+
+
+def issue_html(pair, severity, explanations):
+    excipient1, excipient2 = pair
+    explanation = explanations.get(tuple(sorted(pair)), engine.NO_EXPLANATION)
+    return severity_tooltip_html(severity, f"{excipient1} & {excipient2}", explanation)
+
+
+def rule_html(match):
+    rule = match.rule
+    title = f"{rule.rule_id}: {' + '.join(match.present)}"
+    if rule.condition:
+        title += f" ({rule.condition})"
+    return severity_tooltip_html(match.severity, title, rule.rationale or NO_RULE_EXPLANATION)
+
+
+def issue_list_markdown(issues, explanations, rule_matches=()):
+    """Markdown list of pairwise issues followed by triggered rules, for a single st.markdown call."""
+    lines = [f"- **{a}** & **{b}** → {issue_html((a, b), severity, explanations)}" for (a, b), severity in issues]
+    for match in rule_matches:
+        names = " + ".join(f"**{e}**" for e in match.present)
+        lines.append(f"- {names} → {rule_html(match)}")
+    return "\n".join(lines)
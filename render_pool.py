@@ -0,0 +1,47 @@
+"""Background rendering of matrix figures and PDF reports for the app.
+
+A RenderPool runs render jobs on a fixed number of worker threads shared by all
+sessions, so however many results pages open at once only `max_workers`
+matplotlib/reportlab renders run concurrently and the rest queue. Jobs are keyed: a key
+that is queued, running or recently finished returns the same Future instead of
+rendering again, and the newest `max_entries` jobs are kept as a cache. A failed job is
+resubmitted the next time its key is asked for.
+
+    pool = RenderPool()
+    future = pool.submit(("matrix", excipients, kb.version), figures.matrix_png, excipients, matrix)
+    if future.done():
+        png = future.result()
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+RENDER_WORKERS = 2  # matrix figures and PDF reports rendered at once across all sessions
+RENDER_CACHE_SIZE = 64
+
+
+class RenderPool:
+    def __init__(self, max_workers=RENDER_WORKERS, max_entries=RENDER_CACHE_SIZE):
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """The Future for `key`, submitting `fn(*args)` only if there is none (or it failed)."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._futures.move_to_end(key)
+                return future
+            future = self._executor.submit(fn, *args)
+            self._futures[key] = future
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)  # an evicted job still finishes for whoever holds its Future
+            return future
+
+    def pending(self):
+        """Jobs queued or running."""
+        with self._lock:
+            return sum(not future.done() for future in self._futures.values())
@@ -0,0 +1,237 @@
+"""PDF compatibility reports: paginated single-formulation reports and combined batch reports.
+
+Text and images flow onto new pages as needed, so long excipient lists and findings no
+longer run off the page. Matrix images are embedded straight from PNG bytes in memory.
+Batch reports are written in one pass: each formulation is checked, rendered and drawn
+before the next one is read. The reportlab canvas keeps every finished page until the
+PDF is saved, so one file's memory grows with its page count; `--per-file N` splits a
+large library into volumes of N formulations (report-001.pdf, report-002.pdf, ...) to
+bound it.
+
+    python report.py library.csv report.pdf --id-column id --per-file 500
+"""
+import argparse
+import itertools
+import os
+from datetime import datetime
+from io import BytesIO
+
+from reportlab.lib.colors import black, gray, orange, red
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+import engine
+import figures
+import knowledge_base
+import screen
+
+SEVERITY_COLOURS = {"Major": red, "Minor": orange}
+
+
+class ReportWriter:
+    """Top-to-bottom canvas writer that starts a new page whenever the next block does not fit."""
+
+    def __init__(self, target, pagesize=letter, margin=55):
+        self.canvas = canvas.Canvas(target, pagesize=pagesize, pageCompression=1)
+        self.width, self.height = pagesize
+        self.margin = margin
+        self.page = 1
+        self.y = self.height - margin
+
+    @property
+    def text_width(self):
+        return self.width - 2 * self.margin
+
+    def new_page(self):
+        self._footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - self.margin
+
+    def ensure(self, height):
+        if self.y - height < self.margin:
+            self.new_page()
+
+    def space(self, height):
+        self.y -= height
+
+    def text(self, text, font="Helvetica", size=10, colour=black, indent=0, leading=None):
+        """Draws `text`, wrapped to the page width; lines that do not fit continue on the next page."""
+        leading = leading or size + 4
+        for line in simpleSplit(text, font, size, self.text_width - indent) or [""]:
+            self.ensure(leading)
+            self.canvas.setFont(font, size)
+            self.canvas.setFillColor(colour)
+            self.canvas.drawString(self.margin + indent, self.y - size, line)
+            self.y -= leading
+        self.canvas.setFillColor(black)
+
+    def centred(self, text, font="Helvetica-Bold", size=16):
+        self.ensure(size + 14)
+        self.canvas.setFont(font, size)
+        self.canvas.drawCentredString(self.width / 2, self.y - size, text)
+        self.y -= size + 14
+
+    def columns(self, items, count=2, font="Helvetica", size=10):
+        """Lays `items` out in `count` columns, filled row by row; long items wrap within their column."""
+        leading = size + 4
+        column_width = self.text_width / count
+        for start in range(0, len(items), count):
+            wrapped = [simpleSplit(item, font, size, column_width - 10) or [""] for item in items[start:start + count]]
+            for n in range(max(len(lines) for lines in wrapped)):
+                self.ensure(leading)
+                self.canvas.setFont(font, size)
+                for k, lines in enumerate(wrapped):
+                    if n < len(lines):
+                        self.canvas.drawString(self.margin + k * column_width, self.y - size, lines[n])
+                self.y -= leading
+
+    def image(self, png, max_height=320):
+        reader = ImageReader(BytesIO(png))
+        image_width, image_height = reader.getSize()
+        scale = min(self.text_width / image_width, max_height / image_height)
+        width, height = image_width * scale, image_height * scale
+        self.ensure(height)
+        self.canvas.drawImage(reader, self.margin + (self.text_width - width) / 2, self.y - height,
+                              width=width, height=height, mask='auto')
+        self.y -= height + 10
+
+    def _footer(self):
+        self.canvas.setFont("Helvetica", 8)
+        self.canvas.setFillColor(gray)
+        self.canvas.drawRightString(self.width - self.margin, self.margin / 2, f"Page {self.page}")
+        self.canvas.setFillColor(black)
+
+    def save(self):
+        self._footer()
+        self.canvas.save()
+
+
+def write_formulation(writer, excipients, issues, explanations, matrix_png=None, title=None, rule_matches=()):
+    if title:
+        writer.centred(title, size=13)
+
+    writer.text("Formulation Excipients:", font="Helvetica-Bold", size=12)
+    writer.columns(sorted(excipients))
+    writer.space(10)
+
+    writer.text("Incompatibility Findings:", font="Helvetica-Bold", size=12)
+    if not issues and not rule_matches:
+        writer.text("No incompatibilities found.")
+    for pair, severity in issues:
+        writer.text(f"{pair[0]} & {pair[1]} – {severity}", font="Helvetica-Bold",
+                    colour=SEVERITY_COLOURS.get(severity, black))
+        writer.text(explanations.get(tuple(sorted(pair)), engine.NO_EXPLANATION), size=9, colour=gray, indent=12)
+        writer.space(4)
+    for match in rule_matches:
+        rule = match.rule
+        condition = f" (under {rule.condition})" if rule.condition else ""
+        writer.text(f"{' + '.join(match.present)} – {match.severity}{condition}", font="Helvetica-Bold",
+                    colour=SEVERITY_COLOURS.get(match.severity, black))
+        writer.text(f"Rule {rule.rule_id}: {rule.rationale or engine.NO_EXPLANATION}", size=9, colour=gray, indent=12)
+        writer.space(4)
+    writer.space(10)
+
+    if matrix_png is not None:
+        writer.ensure(40)
+        writer.centred("Adjacency Matrix", size=12)
+        writer.image(matrix_png)
+
+
+def generate_pdf_report(excipients, issues, matrix_png, explanations=None, rule_matches=()):
+    buffer = BytesIO()
+    writer = ReportWriter(buffer)
+    writer.text(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    writer.space(6)
+    writer.centred("Excipient Incompatibility Report")
+    write_formulation(writer, excipients, issues, explanations or {}, matrix_png, rule_matches=rule_matches)
+    writer.save()
+    buffer.seek(0)
+    return buffer
+
+
+def generate_batch_report(formulations, kb, target, render_matrix=True, dpi=72):
+    """One combined PDF for an iterable of (name, excipients), one formulation per page or more.
+
+    `target` is a path or binary file object. Returns the number of formulations written.
+    Pages are held in memory until the file is saved; see `write_volumes` for large libraries.
+    """
+    writer = ReportWriter(target)
+    writer.text(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    writer.space(6)
+    writer.centred("Excipient Incompatibility Report")
+    count = 0
+    for name, excipients in formulations:
+        if count:
+            writer.new_page()
+        issues = engine.check_compatibility(excipients, kb)
+        rule_matches = kb.rules.evaluate(excipients)
+        matrix_png = None
+        if render_matrix and excipients:
+            ordered = sorted(e.strip() for e in excipients)
+            matrix_png = figures.matrix_png(ordered, engine.severity_submatrix(ordered, kb), dpi=dpi)
+        title = f"{name} – {engine.worst_severity(issues + [(m.present, m.severity) for m in rule_matches])}"
+        write_formulation(writer, excipients, issues, kb.explanations, matrix_png, title=title, rule_matches=rule_matches)
+        count += 1
+    writer.save()
+    return count
+
+
+def volume_path(output, number):
+    stem, ext = os.path.splitext(output)
+    return f"{stem}-{number:03d}{ext or '.pdf'}"
+
+
+def write_volumes(formulations, kb, output, per_file, render_matrix=True):
+    """Batch report split into PDFs of at most `per_file` formulations each, so only one
+    volume's pages are in memory at a time. Returns (formulations written, paths)."""
+    formulations = iter(formulations)
+    count, paths = 0, []
+    while True:
+        first = next(formulations, None)
+        if first is None:
+            return count, paths
+        path = volume_path(output, len(paths) + 1)
+        volume = itertools.chain([first], itertools.islice(formulations, per_file - 1))
+        count += generate_batch_report(volume, kb, path, render_matrix=render_matrix)
+        paths.append(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write one combined PDF report for a CSV/Parquet library of formulations.")
+    parser.add_argument("input", help="CSV or Parquet file, one formulation per row (same layout as screen.py)")
+    parser.add_argument("output", help="PDF file to write")
+    parser.add_argument("--column", default="excipients", help="list column; if absent, every cell is one excipient")
+    parser.add_argument("--separator", default=";", help="separator inside the list column (default: ';')")
+    parser.add_argument("--id-column", default=None, help="column used as the formulation name")
+    parser.add_argument("--no-matrix", action="store_true", help="skip the adjacency matrix images")
+    parser.add_argument("--normalize", action="store_true", help="resolve free-text names (synonyms, casing, typos)")
+    parser.add_argument("--per-file", type=int, default=0,
+                        help="formulations per PDF; writes OUTPUT-001.pdf, OUTPUT-002.pdf, ... (default: one file)")
+    args = parser.parse_args()
+    if args.per_file < 0:
+        parser.error("--per-file must be 0 (one file) or a positive number of formulations")
+    kb = knowledge_base.load()
+
+    def formulations():
+        row = 0
+        for frame in screen.read_chunks(args.input, 1_000):
+            names = frame[args.id_column] if args.id_column else range(row + 1, row + len(frame) + 1)
+            parsed = screen.parse_formulations(frame, args.column, args.separator, args.id_column, row)
+            if args.normalize:
+                parsed, _ = screen.resolve_formulations(parsed, kb)
+            for name, excipients in zip(names, parsed):
+                yield f"Formulation {name}" if not args.id_column else str(name), excipients
+            row += len(frame)
+
+    if args.per_file:
+        count, paths = write_volumes(formulations(), kb, args.output, args.per_file, render_matrix=not args.no_matrix)
+        print(f"Wrote {count} formulations to {len(paths)} files: {', '.join(paths)}")
+    else:
+        count = generate_batch_report(formulations(), kb, args.output, render_matrix=not args.no_matrix)
+        print(f"Wrote {count} formulations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Higher-order (ternary and larger) incompatibility rules.
+
+Rules come from the optional workbook "data/Excipient Interaction Rules.xlsx", one rule
+per row:
+
+    Rule ID     | Excipients                                 | Min Present | Condition | Severity | Rationale
+    R1          | Citric Acid; Sodium Bicarbonate; Povidone  |             |           | Major    | ...
+    R2          | Dextrose; Fructose; Sucrose                | 2           | Moisture  | Minor    | ...
+
+A rule fires when at least "Min Present" of its excipients are in the formulation (blank
+means all of them) and its condition, if any, is active. "A + B is fine unless C is
+present" is the all-of rule {A, B, C}.
+
+Rules are compiled into an index keyed by trigger excipient. A rule needing k of its n
+excipients is indexed under only n - k + 1 of them, because any k present members must
+include one of those. Evaluating a formulation therefore touches only rules that one of
+its members can fire.
+"""
+from collections import Counter
+from dataclasses import dataclass
+
+import pandas as pd
+
+SEVERITIES = ("Major", "Minor")
+
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    excipients: tuple
+    min_present: int
+    condition: str  # "" = always applies
+    severity: str
+    rationale: str
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    rule: Rule
+    present: tuple  # the rule's excipients found in the formulation
+
+    @property
+    def severity(self):
+        return self.rule.severity
+
+
+class RuleSet:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.conditions = sorted({r.condition for r in self.rules if r.condition})
+        usage = Counter(name for rule in self.rules for name in rule.excipients)
+        self.index = {}
+        for position, rule in enumerate(self.rules):
+            # The least used excipients make the most selective triggers.
+            by_rarity = sorted(rule.excipients, key=lambda name: (usage[name], name))
+            for name in by_rarity[:len(rule.excipients) - rule.min_present + 1]:
+                self.index.setdefault(name, []).append(position)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, excipients, conditions=()):
+        """[RuleMatch, ...] for the rules fired by `excipients` under the active `conditions`."""
+        present = {e.strip() for e in excipients}
+        active = set(conditions)
+        candidates = set()
+        for name in present:
+            candidates.update(self.index.get(name, ()))
+
+        matches = []
+        for position in sorted(candidates):
+            rule = self.rules[position]
+            if rule.condition and rule.condition not in active:
+                continue
+            found = tuple(name for name in rule.excipients if name in present)
+            if len(found) >= rule.min_present:
+                matches.append(RuleMatch(rule, found))
+        return matches
+
+    def to_records(self):
+        return [
+            [r.rule_id, list(r.excipients), r.min_present, r.condition, r.severity, r.rationale]
+            for r in self.rules
+        ]
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(Rule(rule_id, tuple(names), min_present, condition, severity, rationale)
+                   for rule_id, names, min_present, condition, severity, rationale in records)
+
+
+def _text(value):
+    return "" if pd.isna(value) else str(value).strip()
+
+
+def load_rules(path):
+    """Returns (RuleSet, messages). A missing workbook means no rules; bad rows are skipped and reported."""
+    try:
+        rules_df = pd.read_excel(path)
+    except FileNotFoundError:
+        return RuleSet(), ()
+    rules_df.columns = rules_df.columns.str.strip()
+    missing = [c for c in ("Excipients", "Severity") if c not in rules_df.columns]
+    if missing:
+        return RuleSet(), (("error", f"Error reading '{path}': Missing expected column(s) {missing}. Rules were not loaded."),)
+
+    rules, skipped = [], []
+    for number, row in enumerate(rules_df.to_dict("records"), start=2):
+        names = tuple(dict.fromkeys(n.strip() for n in _text(row.get("Excipients")).split(";") if n.strip()))
+        severity = _text(row.get("Severity")).capitalize()
+        min_present = _text(row.get("Min Present"))
+        try:
+            min_present = int(float(min_present)) if min_present else len(names)
+        except ValueError:
+            min_present = 0
+        if len(names) < 2 or severity not in SEVERITIES or not 2 <= min_present <= len(names):
+            skipped.append(number)
+            continue
+        rules.append(Rule(
+            rule_id=_text(row.get("Rule ID")) or f"Row {number}",
+            excipients=names,
+            min_present=min_present,
+            condition=_text(row.get("Condition")),
+            severity=severity,
+            rationale=_text(row.get("Rationale")),
+        ))
+
+    messages = ()
+    if skipped:
+        messages = (("warning", f"Skipped {len(skipped)} invalid rule row(s) in '{path}': {skipped[:10]}"),)
+    return RuleSet(rules), messages
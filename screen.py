@@ -0,0 +1,267 @@
+"""Batch compatibility screening of formulation libraries from the command line.
+
+Input is CSV or Parquet with one formulation per row: either a list column (default
+"excipients": items separated by ";", or a Parquet list<string> column) or, if that
+column is absent, one excipient per cell. A list cell of any other type stops the run
+with its row number rather than screening the row as empty. With --normalize,
+free-text names (trade names, casing, grade suffixes, typos) are resolved to grid names
+first and names that do not resolve are reported per row. Multi-excipient rules are
+evaluated per row too (under the --condition values given) and count towards the worst
+severity and issue count. Rows are read and written in chunks, and the severity matrix
+is shared with the worker processes through shared memory, so memory stays flat on very
+large files.
+
+    python screen.py library.csv results.csv --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import engine
+import knowledge_base
+from compact import PackedSeverity
+from rules import RuleSet
+
+_worker_kb = None
+_worker_shm = None
+
+
+# --- Input / output ---
+def read_chunks(path, chunksize):
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+class ResultWriter:
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith((".parquet", ".pq"))
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def parse_list_cell(value, separator, row):
+    """Names in one list-column cell: a separated string or a list/tuple/array (Parquet list<string>)."""
+    if isinstance(value, str):
+        return [item for item in value.split(separator) if item.strip()]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        items = [item for item in value if item is not None]
+        if not all(isinstance(item, str) for item in items):
+            raise ValueError(f"Row {row}: excipient list contains non-text items: {list(value)!r}")
+        return [item for item in items if item.strip()]
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []  # empty cell
+    raise ValueError(f"Row {row}: cannot read an excipient list from a {type(value).__name__} value: {value!r}")
+
+
+def parse_formulations(frame, column, separator, id_column=None, first_row=0):
+    """Excipient names per row; a list-column cell that is neither text nor a list of text raises ValueError."""
+    if column in frame.columns:
+        return [parse_list_cell(value, separator, first_row + i) for i, value in enumerate(frame[column])]
+    cells = frame.drop(columns=[id_column]) if id_column else frame
+    return [[v for v in row if isinstance(v, str) and v.strip()] for row in cells.itertuples(index=False)]
+
+
+def format_issues(issues):
+    return "; ".join(f"{a} & {b}: {severity}" for (a, b), severity in issues)
+
+
+def format_rule_matches(rule_matches):
+    return "; ".join(f"{m.rule.rule_id} ({' + '.join(m.present)}): {m.severity}" for m in rule_matches)
+
+
+def resolve_formulations(formulations, kb):
+    """Grid names for each formulation, plus the "; "-joined names that did not resolve."""
+    resolved, unresolved = [], []
+    for names in formulations:
+        excipients, missing = kb.name_index.resolve_many(names)
+        resolved.append(excipients)
+        unresolved.append("; ".join(r.name.strip() for r in missing))
+    return resolved, unresolved
+
+
+def screen_chunk(kb, frame, first_row, column, separator, id_column, normalize=False, conditions=()):
+    formulations = parse_formulations(frame, column, separator, id_column, first_row)
+    if normalize:
+        formulations, unresolved = resolve_formulations(formulations, kb)
+    result = engine.check_many(formulations, kb)
+    rule_matches = [kb.rules.evaluate(excipients, conditions) for excipients in formulations]
+    out = pd.DataFrame({
+        "row": np.arange(first_row, first_row + len(frame)),
+        "worst_severity": [
+            engine.worst_severity([(None, result.worst_label(i))] + [(m.present, m.severity) for m in matches])
+            for i, matches in enumerate(rule_matches)
+        ],
+        "issue_count": [len(issues) + len(matches) for issues, matches in zip(result.issues, rule_matches)],
+        "issues": [format_issues(issues) for issues in result.issues],
+        "rules": [format_rule_matches(matches) for matches in rule_matches],
+    })
+    if normalize:
+        out["unresolved"] = unresolved
+    if id_column:
+        out.insert(1, id_column, frame[id_column].to_numpy())
+    return out
+
+
+# --- Workers ---
+def _init_worker(shm_name, shape, names, version, synonyms, rule_records):
+    """Attaches to the shared severity matrix once per worker instead of unpickling a copy per task."""
+    global _worker_kb, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    matrix = np.ndarray(shape, dtype=np.int8, buffer=_worker_shm.buf)
+    if len(shape) == 1:  # packed upper triangle
+        matrix = PackedSeverity(matrix, len(names))
+    _worker_kb = knowledge_base.KnowledgeBase(
+        descriptions={},
+        explanations={},
+        severity_matrix=matrix,
+        excipient_ids={name: i for i, name in enumerate(names)},
+        excipient_list=names,
+        version=version,
+        load_seconds=0.0,
+        source="shared-memory",
+        rules=RuleSet.from_records(rule_records),
+        synonyms=synonyms,
+    )
+
+
+def _screen_in_worker(frame, first_row, column, separator, id_column, normalize, conditions):
+    return screen_chunk(_worker_kb, frame, first_row, column, separator, id_column, normalize, conditions)
+
+
+def share_matrix(matrix):
+    """(shared memory block, shape) holding the dense matrix, or the packed data of a PackedSeverity."""
+    if isinstance(matrix, PackedSeverity):
+        matrix = matrix.data
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    np.ndarray(matrix.shape, dtype=np.int8, buffer=shm.buf)[:] = matrix
+    return shm, matrix.shape
+
+
+# --- Driver ---
+class Progress:
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.rows = 0
+
+    def update(self, rows):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.start
+        print(f"\r{self.rows:,} formulations  {self.rows / elapsed:,.0f}/s", end="", file=self.stream, flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.rows / elapsed if elapsed else 0.0
+        print(f"\rScreened {self.rows:,} formulations in {elapsed:.1f}s ({rate:,.0f}/s)", file=self.stream)
+
+
+def screen(input_path, output_path, workers=None, chunksize=20_000, column="excipients", separator=";", id_column=None,
+           normalize=False, conditions=()):
+    kb = knowledge_base.load()
+    unknown = sorted(set(conditions) - set(kb.rules.conditions))
+    if unknown:
+        raise ValueError(f"Unknown condition(s) {unknown}; the rules use {kb.rules.conditions or 'none'}.")
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output_path)
+    progress = Progress()
+    chunks = read_chunks(input_path, chunksize)
+
+    try:
+        if workers == 1:
+            first_row = 0
+            for frame in chunks:
+                writer.write(screen_chunk(kb, frame, first_row, column, separator, id_column, normalize, conditions))
+                first_row += len(frame)
+                progress.update(len(frame))
+            return progress.rows
+
+        shm, shape = share_matrix(kb.severity_matrix)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(shm.name, shape, kb.excipient_list, kb.version, kb.synonyms, kb.rules.to_records()),
+            ) as pool:
+                # Bounded window of in-flight chunks; results are written in input order.
+                pending, done, next_to_write, first_row, index = {}, {}, 0, 0, 0
+                exhausted = False
+                while not exhausted or pending:
+                    while not exhausted and len(pending) < 2 * workers:
+                        frame = next(chunks, None)
+                        if frame is None:
+                            exhausted = True
+                            break
+                        future = pool.submit(_screen_in_worker, frame, first_row, column, separator, id_column, normalize,
+                                             conditions)
+                        pending[future] = index
+                        first_row += len(frame)
+                        index += 1
+                    if not pending:
+                        break
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done[pending.pop(future)] = future.result()
+                    while next_to_write in done:
+                        out = done.pop(next_to_write)
+                        writer.write(out)
+                        progress.update(len(out))
+                        next_to_write += 1
+        finally:
+            shm.close()
+            shm.unlink()
+        return progress.rows
+    finally:
+        writer.close()
+        progress.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen a CSV/Parquet library of formulations for excipient incompatibilities.")
+    parser.add_argument("input", help="CSV or Parquet file, one formulation per row")
+    parser.add_argument("output", help="results file (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores; 1 runs in-process)")
+    parser.add_argument("--chunksize", type=int, default=20_000, help="rows per chunk (default: 20000)")
+    parser.add_argument("--column", default="excipients", help="list column; if absent, every cell is one excipient")
+    parser.add_argument("--separator", default=";", help="separator inside the list column (default: ';')")
+    parser.add_argument("--id-column", default=None, help="input column copied to the output to identify rows")
+    parser.add_argument("--normalize", action="store_true",
+                        help="resolve free-text names (synonyms, casing, typos) and report unresolved ones")
+    parser.add_argument("--condition", action="append", default=[], dest="conditions",
+                        help="processing/storage condition for conditional rules (repeatable)")
+    args = parser.parse_args()
+
+    screen(args.input, args.output, args.workers, args.chunksize, args.column, args.separator, args.id_column,
+           args.normalize, args.conditions)
+
+
+if __name__ == "__main__":
+    main()